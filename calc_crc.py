@@ -1,28 +1,73 @@
 #! /usr/env/bin python3
 
+from __future__ import annotations
+
+import argparse
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+import random
 import struct
 import sys
+import time
+import zlib
+import numpy as np
+
+CRC_START = 0x1000
+CRC_END = 0x101000
+CRC_WORD_COUNT = (CRC_END - CRC_START) // 4
+
+CIC_SEEDS = {
+    6101: 0xF8CA4DDC,
+    6102: 0xF8CA4DDC,
+    6103: 0xA3886759,
+    6105: 0xDF26F436,
+    6106: 0x1FEA617A,
+}
+
+# CRC32 of the IPL3 boot code (0x40 to 0x1000) shipped with each CIC
+IPL3_START = 0x40
+IPL3_END = 0x1000
+CIC_PER_IPL3_CRC32 = {
+    0x6170A4A1: 6101,
+    0x90BB6CB5: 6102,
+    0x0B050EE0: 6103,
+    0x98BC2C86: 6105,
+    0xACC8580A: 6106,
+}
+
+DEFAULT_CIC = 6105
+
+GAMES = ["oot", "mm", "dnm"]
 
 def as_word(b, off=0):
     return struct.unpack(">I", b[off:off+4])[0]
 
-def calc_crc(rom_data, cic_type):
-    start = 0x1000
-    end = 0x101000
+def getCicSeed(cic_type: int) -> int:
+    assert cic_type in CIC_SEEDS, f"Unknown cic type: {cic_type}"
+    return CIC_SEEDS[cic_type]
+
+def detectCic(rom_data) -> int | None:
+    ipl3Crc = zlib.crc32(memoryview(rom_data)[IPL3_START:IPL3_END])
+    return CIC_PER_IPL3_CRC32.get(ipl3Crc)
+
+def detectCicOrDefault(rom_data, warn: bool = True) -> int:
+    """Detects the CIC from the IPL3, assuming `DEFAULT_CIC` (with a warning) if it is unknown."""
+    cic_type = detectCic(rom_data)
+    if cic_type is None:
+        if warn:
+            print(f"Unknown IPL3, assuming CIC {DEFAULT_CIC}.")
+        return DEFAULT_CIC
+    return cic_type
+
+def calc_crc_reference(rom_data, cic_type):
+    """Word-by-word implementation, kept to check `calc_crc` against it"""
+    start = CRC_START
+    end = CRC_END
 
     unsigned_long = lambda i: i & 0xFFFFFFFF
     rol = lambda i, b: unsigned_long(i << b) | (i >> (-b & 0x1F))
 
-    if cic_type == 6101 or cic_type == 6102:
-        seed = 0xF8CA4DDC
-    elif cic_type == 6103:
-        seed = 0xA3886759
-    elif cic_type == 6105:
-        seed = 0xDF26F436
-    elif cic_type == 6106:
-        seed = 0x1FEA617A
-    else:
-        assert False , f"Unknown cic type: {cic_type}"
+    seed = getCicSeed(cic_type)
 
     t1 = t2 = t3 = t4 = t5 = t6 = seed
 
@@ -47,6 +92,11 @@ def calc_crc(rom_data, cic_type):
         else:
             t1 = unsigned_long(t1 + (t5 ^ d))
 
+    return packChecksum(cic_type, t1, t2, t3, t4, t5, t6)
+
+def packChecksum(cic_type: int, t1: int, t2: int, t3: int, t4: int, t5: int, t6: int) -> bytes:
+    unsigned_long = lambda i: i & 0xFFFFFFFF
+
     chksum = [0,0]
 
     if cic_type == 6103:
@@ -61,12 +111,137 @@ def calc_crc(rom_data, cic_type):
 
     return struct.pack(">II", chksum[0], chksum[1])
 
+def calc_crc(rom_data, cic_type):
+    seed = getCicSeed(cic_type)
+    mask = 0xFFFFFFFF
+
+    # Widen to 64 bits so the running sums can't overflow (0x40000 words * 2^32 < 2^64)
+    d = np.frombuffer(rom_data, dtype=">u4", count=CRC_WORD_COUNT, offset=CRC_START).astype(np.uint64)
+
+    shift = d & 0x1F
+    r = ((d << shift) & mask) | (d >> ((np.uint64(32) - shift) & 0x1F))
+
+    # t6 is a running sum and t4 counts how many times it wrapped around
+    t6Sums = np.cumsum(d) + seed
+    t6Steps = t6Sums & mask
+    t6 = int(t6Steps[-1])
+    t4 = (seed + (int(t6Sums[-1]) >> 32)) & mask
+
+    t3 = seed ^ int(np.bitwise_xor.reduce(d))
+
+    t5Steps = (np.cumsum(r) + seed) & mask
+    t5 = int(t5Steps[-1])
+
+    if cic_type == 6105:
+        lut = np.frombuffer(rom_data, dtype=">u4", count=0x40, offset=0x0750).astype(np.uint64)
+        t1 = (seed + int(np.sum(np.tile(lut, CRC_WORD_COUNT // 0x40) ^ d))) & mask
+    else:
+        t1 = (seed + int(np.sum(t5Steps ^ d))) & mask
+
+    # t2 depends on its own previous value, so it has to be a sequential loop
+    t2 = seed
+    for dWord, rWord, t6Word in zip(d.tolist(), r.tolist(), t6Steps.tolist()):
+        if t2 > dWord:
+            t2 ^= rWord
+        else:
+            t2 ^= t6Word ^ dWord
+
+    return packChecksum(cic_type, t1, t2, t3, t4, t5, t6)
+
+
+def benchmark(rom_data, iterations: int):
+    for cic_type in CIC_SEEDS:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            expected = calc_crc_reference(rom_data, cic_type)
+        referenceTime = (time.perf_counter() - start) / iterations
+
+        start = time.perf_counter()
+        for _ in range(iterations):
+            got = calc_crc(rom_data, cic_type)
+        fastTime = (time.perf_counter() - start) / iterations
+
+        assert got == expected, f"CIC {cic_type}: got {got.hex()}, expected {expected.hex()}"
+        print(f"CIC {cic_type}: {got.hex()}  reference: {referenceTime*1000:8.2f}ms  numpy: {fastTime*1000:8.2f}ms  (x{referenceTime/fastTime:.1f})")
+
+def verifyRomCrc(romPath: Path) -> tuple[Path, int | None, bool, str, str]:
+    """Returns the path, the CIC (None if the ROM is too small), whether the CIC was assumed, and the stored and calculated checksums."""
+    with romPath.open(mode="rb") as f:
+        # The checksum only covers up to CRC_END, and the CIC is detected from the IPL3 before it
+        fileContent = f.read(CRC_END)
+
+    stored = fileContent[0x10:0x18].hex()
+    if len(fileContent) < CRC_END:
+        return romPath, None, False, stored, ""
+
+    # Same policy as `update_crc` in the (de)compression scripts
+    cic_type = detectCicOrDefault(fileContent, warn=False)
+    assumed = detectCic(fileContent) is None
+    return romPath, cic_type, assumed, stored, calc_crc(fileContent, cic_type).hex()
+
+def findRomsToVerify() -> list[Path]:
+    roms = []
+    for game in GAMES:
+        roms.extend(sorted(Path(game).glob(f"{game}_*.z64")))
+    return roms
+
+def verifyAll(num_cores: int) -> bool:
+    roms = findRomsToVerify()
+    if len(roms) == 0:
+        print("No ROMs found.")
+        return True
+
+    allOk = True
+    with Pool(min(num_cores, len(roms))) as p:
+        for romPath, cic_type, assumed, stored, calculated in p.imap(verifyRomCrc, roms):
+            if cic_type is None:
+                status = "TOO SMALL"
+                allOk = False
+            elif stored == calculated:
+                status = "OK"
+            else:
+                status = f"BAD (calculated {calculated})"
+                allOk = False
+            if assumed:
+                status += f" (unknown IPL3, assumed CIC {DEFAULT_CIC})"
+            print(f"{str(romPath):<40} {str(cic_type):<5} {stored} {status}")
+
+    return allOk
+
 def main():
-    romFileName = sys.argv[1]
-    with open(romFileName, mode="rb") as f:
-        fileContent = f.read()
-        new_crc = calc_crc(fileContent, 6105)
-        print(new_crc.hex())
+    description = "Calculates the header checksum of a N64 ROM."
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("rom", help="Big-endian ROM to checksum. If benchmarking and no rom is given, random data is used instead.", nargs="?")
+    parser.add_argument("--cic", help="CIC type used by the ROM. Detected from the IPL3 by default.", type=int, choices=sorted(CIC_SEEDS))
+    parser.add_argument("--verify-all", help="Check the stored header checksum of every '{game}/{game}_{version}.z64' and '_uncompressed.z64' ROM.", action="store_true")
+    parser.add_argument("-j", help="Number of processes used by --verify-all. Defaults to every CPU core.", type=int, default=cpu_count())
+    parser.add_argument("--bench", help="Compare the checksum against the reference implementation for every CIC type and time both.", action="store_true")
+    parser.add_argument("--iterations", help="Iterations per CIC type when benchmarking.", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.verify_all:
+        if not verifyAll(args.j):
+            sys.exit(1)
+        return
+
+    if args.rom is None:
+        if not args.bench:
+            parser.error("a rom is required unless --bench or --verify-all is used")
+        fileContent = random.Random(0).randbytes(CRC_END)
+    else:
+        with open(args.rom, mode="rb") as f:
+            fileContent = f.read()
+
+    if args.bench:
+        benchmark(fileContent, args.iterations)
+        return
+
+    cic_type = args.cic
+    if cic_type is None:
+        cic_type = detectCicOrDefault(fileContent)
+    new_crc = calc_crc(fileContent, cic_type)
+    print(new_crc.hex())
 
 
 if __name__ == "__main__":
@@ -3,12 +3,33 @@
 from __future__ import annotations
 
 import argparse
+from collections import Counter
 from multiprocessing import Pool, cpu_count
 from functools import partial
+import json
+import os
 from pathlib import Path
+import pickle
+import sys
+import time
+from typing import Callable, Iterator, TextIO
 import spimdisasm
 
+from data_hash import hash_data
 from tools.mips.ZeldaTables import contextReadVariablesCsv, contextReadFunctionsCsv, getFileAddresses, FileAddressesEntry
+from rom_archive import readBaseromFile
+from section_hash_cache import SectionHashCache
+from tools.mips.DmaTable import DmaTable
+
+
+# (file hash, splits hash, context tables hash, vram)
+AnalysisKey = tuple[str, str, str, int]
+
+# The arguments of `compareOverlayAcrossVersions` besides the filename, set up once per worker by `initializeWorker`
+workerCompareArguments: dict = dict()
+
+# Identical files extracted with `extract_baserom.py --store` are hardlinks to the same object, so each inode is only read and hashed once per process
+fileHashPerInode: dict[tuple[int, int], str] = dict()
 
 
 def countUnique(row: list) -> int:
@@ -35,15 +56,26 @@ def removePointers(args, filedata: bytearray) -> bytearray:
 
 def getHashesOfFiles(args, filesPath: list[Path]) -> list[str]:
     hashList = []
+    # Identical files extracted with `extract_baserom.py --store` are hardlinks to the same object, so hash each inode once
+    hashPerInode: dict[tuple[int, int], str] = dict()
     for path in filesPath:
-        f = spimdisasm.common.Utils.readFileAsBytearray(path)
-        if len(f) != 0:
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        inode = (stat.st_dev, stat.st_ino)
+        fHash = hashPerInode.get(inode)
+        if fHash is None:
+            f = spimdisasm.common.Utils.readFileAsBytearray(path)
+            if len(f) == 0:
+                continue
             fHash = spimdisasm.common.Utils.getStrHash(removePointers(args, f))
-            line = fHash + " " + str(path) # To be consistent with runCommandGetOutput("md5sum", md5arglist)
-            hashList.append(line)
+            hashPerInode[inode] = fHash
+        line = fHash + " " + str(path) # To be consistent with runCommandGetOutput("md5sum", md5arglist)
+        hashList.append(line)
     return hashList
 
-def compareFileAcrossVersions(filename: str, game: str, versionsList: list[str], contextPerVersion: dict[str, spimdisasm.common.Context], fileAddressesPerVersion: dict, args) -> list[list[str]]:
+def compareFileAcrossVersions(filename: str, game: str, versionsList: list[str], contextPerVersion: WorkerContexts | dict[str, spimdisasm.common.Context], fileAddressesPerVersion: dict, contextInputsHashPerVersion: dict[str, str], sectionHashCache: SectionHashCache | None, args) -> list[list[str]]:
     md5arglist = list(map(lambda orig_string: Path(game, orig_string, "baserom", filename), versionsList))
     # os.system( "md5sum " + " ".join(filesPath) )
 
@@ -79,79 +111,141 @@ def compareFileAcrossVersions(filename: str, game: str, versionsList: list[str],
             row.append("")
     return [row]
 
-def compareOverlayAcrossVersions(filename: str, game: str, versionsList: list[str], contextPerVersion: dict[str, spimdisasm.common.Context], fileAddressesPerVersion: dict[str, dict[str, FileAddressesEntry]], args) -> list[list[str]]:
-    column = []
-    filesHashes = dict() # "filename": {"NN0": hash}
-    firstFilePerHash = dict() # "filename": {hash: "NN0"}
-
-    if filename.startswith("#"):
-        return column
-
+def hashTableFiles(tablePaths: list[Path]) -> str:
+    """Hashes the contents of every table together. Missing tables are hashed as empty."""
+    data = bytearray()
+    for tablePath in tablePaths:
+        try:
+            table = tablePath.read_bytes()
+        except OSError:
+            table = b""
+        data.extend(len(table).to_bytes(8, "big"))
+        data.extend(table)
+    return hash_data(data)
+
+def getContextInputsHash(game: str, version: str) -> str:
+    """Hash of the tables that are read into the Context of a version."""
+    tablesPath = Path(game, version, "tables")
+    return hashTableFiles([tablesPath / "variables.csv", tablesPath / "functions.csv"])
+
+def getSectionHashes(filename: str, array_of_bytes: bytearray, context: spimdisasm.common.Context, vramStart: int, splitsData: spimdisasm.common.FileSplitFormat | None) -> dict[str, str]:
+    """Analyzes a file and returns the hash of each of its sections, in the order they are found."""
     is_overlay = filename.startswith("ovl_")
 
-    for version in versionsList:
-        splitsData = None
-        tablePath = Path(game, version, "tables", f"files_{filename}.csv")
-        if tablePath.exists():
-            # print(tablePath)
-            splitsData = spimdisasm.common.FileSplitFormat()
-            splitsData.readCsvFile(tablePath)
+    if is_overlay:
+        relocSection = spimdisasm.mips.sections.SectionRelocZ64(context, 0, len(array_of_bytes), vramStart, filename, array_of_bytes, 0, None)
+        f = spimdisasm.mips.FileSplits(context, 0, len(array_of_bytes), vramStart, filename, array_of_bytes, 0, None, relocSection=relocSection)
+    elif filename in ("code", "boot", "n64dd"):
+        f = spimdisasm.mips.FileSplits(context, 0, len(array_of_bytes), -1, filename, array_of_bytes, 0, None, splitsData=splitsData)
+    else:
+        f = spimdisasm.mips.sections.SectionData(context, 0, len(array_of_bytes), 0, filename, array_of_bytes, 0, None)
 
-        path = Path(game, version, "baserom", filename)
+    f.analyze()
 
-        array_of_bytes = spimdisasm.common.Utils.readFileAsBytearray(path)
-        if len(array_of_bytes) == 0:
-            # print(f"Skipping {path}")
-            continue
+    if spimdisasm.common.GlobalConfig.REMOVE_POINTERS:
+        f.removePointers()
 
-        if is_overlay:
-            vramStart = -1
-            if version in fileAddressesPerVersion:
-                if filename in fileAddressesPerVersion[version]:
-                    vramStart = fileAddressesPerVersion[version][filename].vramStart
+    if isinstance(f, spimdisasm.mips.FileSplits):
+        subfiles = {
+            ".text" : f.sectionsDict[spimdisasm.common.FileSectionType.Text],
+            ".data" : f.sectionsDict[spimdisasm.common.FileSectionType.Data],
+            ".rodata" : f.sectionsDict[spimdisasm.common.FileSectionType.Rodata],
+            #".bss" : f.bss,
+        }
+    else:
+        subfiles = {
+            "" : {"": f},
+        }
+
+    sectionHashes = dict()
+    for sectionName, sectionCat in subfiles.items():
+        for name, sub in sectionCat.items():
+            if is_overlay:
+                name = ""
+            if name != "":
+                name = "." + name
+            sectionHashes[filename + name + sectionName] = sub.getHash()
+    return sectionHashes
+
+def getSectionHashCacheSettings() -> tuple:
+    """Everything besides the inputs of each file that changes the section hashes."""
+    GlobalConfig = spimdisasm.common.GlobalConfig
+    return (spimdisasm.__version__, GlobalConfig.REMOVE_POINTERS, GlobalConfig.IGNORE_BRANCHES, tuple(sorted(GlobalConfig.IGNORE_WORD_LIST)))
+
+def hashBaseromFile(game: str, version: str, filename: str, fromRom: bool) -> str | None:
+    """Hash of a file of the given version, like `hash_data(readBaseromFile(...))`, or None if the version doesn't have the file."""
+    if not fromRom:
+        try:
+            stat = Path(game, version, "baserom", filename).stat()
+        except OSError:
+            stat = None
+        if stat is not None:
+            if stat.st_size == 0:
+                return None
+            inode = (stat.st_dev, stat.st_ino)
+            fHash = fileHashPerInode.get(inode)
+            if fHash is None:
+                fHash = hash_data(readBaseromFile(game, version, filename))
+                fileHashPerInode[inode] = fHash
+            return fHash
+
+    array_of_bytes = readBaseromFile(game, version, filename, fromRom)
+    if len(array_of_bytes) == 0:
+        return None
+    return hash_data(array_of_bytes)
+
+def getAnalysisKey(filename: str, version: str, fileHash: str, game: str, fileAddressesPerVersion: dict[str, dict[str, FileAddressesEntry]], contextInputsHashPerVersion: dict[str, str]) -> AnalysisKey:
+    """Versions with the same bytes, splits, vram and context tables analyze to the same hashes, so a file only needs to be analyzed once per key."""
+    vramStart = -1
+    if filename.startswith("ovl_"):
+        if version in fileAddressesPerVersion:
+            if filename in fileAddressesPerVersion[version]:
+                vramStart = fileAddressesPerVersion[version][filename].vramStart
+
+    tablePath = Path(game, version, "tables", f"files_{filename}.csv")
+    return (fileHash, hashTableFiles([tablePath]), contextInputsHashPerVersion[version], vramStart)
+
+def analyzeFile(filename: str, version: str, array_of_bytes: bytearray, key: AnalysisKey, game: str, contextPerVersion: WorkerContexts | dict[str, spimdisasm.common.Context], sectionHashCache: SectionHashCache | None) -> dict[str, str]:
+    """Returns the section hashes of a file, taking them from the cache if a previous run already analyzed the same key."""
+    if sectionHashCache is not None:
+        sectionHashes = sectionHashCache.get((filename,) + key)
+        if sectionHashes is not None:
+            return sectionHashes
+
+    splitsData = None
+    tablePath = Path(game, version, "tables", f"files_{filename}.csv")
+    if tablePath.exists():
+        # print(tablePath)
+        splitsData = spimdisasm.common.FileSplitFormat()
+        splitsData.readCsvFile(tablePath)
+
+    vramStart = key[3]
+    sectionHashes = getSectionHashes(filename, array_of_bytes, contextPerVersion[version], vramStart, splitsData)
+    if sectionHashCache is not None:
+        sectionHashCache.put((filename,) + key, sectionHashes)
+    return sectionHashes
+
+def makeRows(versionsList: list[str], sectionHashesPerVersion: dict[str, dict[str, str]]) -> list[list[str]]:
+    """Turns the section hashes of every version of a file into csv rows, naming the first version where each hash appears."""
+    column = []
+    filesHashes = dict() # "filename": {"NN0": hash}
+    firstFilePerHash = dict() # "filename": {hash: "NN0"}
 
-            relocSection = spimdisasm.mips.sections.SectionRelocZ64(contextPerVersion[version], 0, len(array_of_bytes), vramStart, filename, array_of_bytes, 0, None)
-            f = spimdisasm.mips.FileSplits(contextPerVersion[version], 0, len(array_of_bytes), vramStart, filename, array_of_bytes, 0, None, relocSection=relocSection)
-        elif filename in ("code", "boot", "n64dd"):
-            f = spimdisasm.mips.FileSplits(contextPerVersion[version], 0, len(array_of_bytes), -1, filename, array_of_bytes, 0, None, splitsData=splitsData)
-        else:
-            f = spimdisasm.mips.sections.SectionData(contextPerVersion[version], 0, len(array_of_bytes), 0, filename, array_of_bytes, 0, None)
+    for version in versionsList:
+        if version not in sectionHashesPerVersion:
+            continue
 
-        f.analyze()
+        for file_section, f_hash in sectionHashesPerVersion[version].items():
+            if file_section not in filesHashes:
+                filesHashes[file_section] = dict()
+                firstFilePerHash[file_section] = dict()
 
-        if spimdisasm.common.GlobalConfig.REMOVE_POINTERS:
-            f.removePointers()
+            # Map each abbreviation to its hash.
+            filesHashes[file_section][version] = f_hash
 
-        if isinstance(f, spimdisasm.mips.FileSplits):
-            subfiles = {
-                ".text" : f.sectionsDict[spimdisasm.common.FileSectionType.Text],
-                ".data" : f.sectionsDict[spimdisasm.common.FileSectionType.Data],
-                ".rodata" : f.sectionsDict[spimdisasm.common.FileSectionType.Rodata],
-                #".bss" : f.bss,
-            }
-        else:
-            subfiles = {
-                "" : {"": f},
-            }
-
-        for sectionName, sectionCat in subfiles.items():
-            for name, sub in sectionCat.items():
-                if is_overlay:
-                    name = ""
-                if name != "":
-                    name = "." + name
-                file_section = filename + name + sectionName
-                if file_section not in filesHashes:
-                    filesHashes[file_section] = dict()
-                    firstFilePerHash[file_section] = dict()
-
-                f_hash = sub.getHash()
-                # Map each abbreviation to its hash.
-                filesHashes[file_section][version] = f_hash
-
-                # Find out where in which version this hash appeared for first time.
-                if f_hash not in firstFilePerHash[file_section]:
-                    firstFilePerHash[file_section][f_hash] = version
+            # Find out where in which version this hash appeared for first time.
+            if f_hash not in firstFilePerHash[file_section]:
+                firstFilePerHash[file_section][f_hash] = version
 
     for file_section in filesHashes:
         row = [file_section]
@@ -165,6 +259,264 @@ def compareOverlayAcrossVersions(filename: str, game: str, versionsList: list[st
 
     return column
 
+def compareOverlayAcrossVersions(filename: str, game: str, versionsList: list[str], contextPerVersion: WorkerContexts | dict[str, spimdisasm.common.Context], fileAddressesPerVersion: dict[str, dict[str, FileAddressesEntry]], contextInputsHashPerVersion: dict[str, str], sectionHashCache: SectionHashCache | None, args) -> list[list[str]]:
+    if filename.startswith("#"):
+        return []
+
+    sectionHashesPerKey: dict[AnalysisKey, dict[str, str]] = dict() # key: {"filename.section": hash}
+    sectionHashesPerVersion: dict[str, dict[str, str]] = dict() # "NN0": {"filename.section": hash}
+
+    for version in versionsList:
+        fileHash = hashBaseromFile(game, version, filename, args.from_rom)
+        if fileHash is None:
+            # print(f"Skipping {path}")
+            continue
+
+        key = getAnalysisKey(filename, version, fileHash, game, fileAddressesPerVersion, contextInputsHashPerVersion)
+        sectionHashes = sectionHashesPerKey.get(key)
+        if sectionHashes is None:
+            # Only the versions that are analyzed need the bytes
+            array_of_bytes = readBaseromFile(game, version, filename, args.from_rom)
+            sectionHashes = analyzeFile(filename, version, array_of_bytes, key, game, contextPerVersion, sectionHashCache)
+            sectionHashesPerKey[key] = sectionHashes
+        sectionHashesPerVersion[version] = sectionHashes
+
+    return makeRows(versionsList, sectionHashesPerVersion)
+
+def buildContext(game: str, version: str) -> spimdisasm.common.Context:
+    context = spimdisasm.common.Context()
+    context.fillDefaultBannedSymbols()
+    context.globalSegment.fillLibultraSymbols()
+    context.globalSegment.fillHardwareRegs()
+    # context.globalSegment.readFunctionMap(version)
+    contextReadVariablesCsv(context, game, version)
+    contextReadFunctionsCsv(context, game, version)
+    return context
+
+class WorkerContexts:
+    """The Context of every version, built the first time a file of that version is analyzed and reused afterwards.
+
+    Each process (every worker, or the main one with --disable-multiprocessing)
+    builds its own, so a worker only pays for the versions it actually analyzes.
+    """
+
+    def __init__(self, game: str):
+        self.game = game
+        self.contexts: dict[str, spimdisasm.common.Context] = dict()
+
+    def __getitem__(self, version: str) -> spimdisasm.common.Context:
+        context = self.contexts.get(version)
+        if context is None:
+            context = buildContext(self.game, version)
+            self.contexts[version] = context
+        return context
+
+def getCompareArguments(game: str, versionsList: list[str], args) -> dict:
+    fileAddressesPerVersion: dict[str, dict[str, FileAddressesEntry]] = dict()
+    for version in versionsList:
+        fileAddressesPerVersion[version] = getFileAddresses(Path(game, version, "tables", "file_addresses.csv"))
+
+    contextInputsHashPerVersion: dict[str, str] = dict()
+    for version in versionsList:
+        contextInputsHashPerVersion[version] = getContextInputsHash(game, version)
+
+    sectionHashCache = None
+    if not args.no_cache:
+        sectionHashCache = SectionHashCache(getSectionHashCacheSettings())
+
+    return {
+        "game": game,
+        "versionsList": versionsList,
+        "contextPerVersion": WorkerContexts(game),
+        "fileAddressesPerVersion": fileAddressesPerVersion,
+        "contextInputsHashPerVersion": contextInputsHashPerVersion,
+        "sectionHashCache": sectionHashCache,
+        "args": args,
+    }
+
+def initializeWorker(game: str, versionsList: list[str], args):
+    global workerCompareArguments
+
+    workerCompareArguments = getCompareArguments(game, versionsList, args)
+
+def hashInWorker(task: tuple[str, str]) -> tuple[str, str, AnalysisKey | None]:
+    filename, version = task
+    game = workerCompareArguments["game"]
+
+    fileHash = hashBaseromFile(game, version, filename, workerCompareArguments["args"].from_rom)
+    if fileHash is None:
+        return filename, version, None
+    return filename, version, getAnalysisKey(filename, version, fileHash, game, workerCompareArguments["fileAddressesPerVersion"], workerCompareArguments["contextInputsHashPerVersion"])
+
+def analyzeInWorker(task: tuple[str, str, AnalysisKey]) -> tuple[str, AnalysisKey, dict[str, str]]:
+    filename, version, key = task
+    game = workerCompareArguments["game"]
+
+    array_of_bytes = readBaseromFile(game, version, filename, workerCompareArguments["args"].from_rom)
+    return filename, key, analyzeFile(filename, version, array_of_bytes, key, game, workerCompareArguments["contextPerVersion"], workerCompareArguments["sectionHashCache"])
+
+
+def readDmaSizes(game: str, versionsList: list[str]) -> dict[tuple[str, str], int]:
+    """Size of every file of every version, according to their `dma_addresses.csv`."""
+    sizes: dict[tuple[str, str], int] = dict()
+    for version in versionsList:
+        tablePath = Path(game, version, "tables", "dma_addresses.csv")
+        if not tablePath.exists():
+            continue
+        dmaTable = DmaTable.fromCsv(tablePath)
+        assert dmaTable.names is not None
+        for name, size in zip(dmaTable.names, dmaTable.sizes.tolist()):
+            sizes[(name, version)] = size
+    return sizes
+
+def compareInParallel(filenames: list[str], game: str, versionsList: list[str], numCores: int, args) -> Iterator[tuple[str, list[list[str]]]]:
+    """Yields the filename and the rows of every file in `filenames`, in the order they are finished, spreading the work as `(file, version)` tasks.
+
+    Every version of every file is hashed first. Then only the first version
+    of each distinct key is analyzed, biggest files first, so a big file like
+    `code` is analyzed by many workers at once instead of one version after
+    the other. The rows of each file are put together (and yielded) as soon
+    as every version it needs is done.
+    """
+    sizes = readDmaSizes(game, versionsList)
+
+    hashTasks = [(filename, version) for filename in filenames for version in versionsList]
+    hashTasks.sort(key=lambda task: sizes.get(task, 0), reverse=True)
+
+    with Pool(numCores, initializeWorker, (game, versionsList, args)) as p:
+        keyPerFileVersion: dict[tuple[str, str], AnalysisKey] = dict()
+        for filename, version, key in p.imap_unordered(hashInWorker, hashTasks, chunksize=8):
+            if key is not None:
+                keyPerFileVersion[(filename, version)] = key
+
+        # The first version (in the version list order) with each key is the one analyzed, the rest reuse its hashes
+        versionPerKey: dict[tuple[str, AnalysisKey], str] = dict()
+        for filename in filenames:
+            for version in versionsList:
+                key = keyPerFileVersion.get((filename, version))
+                if key is not None and (filename, key) not in versionPerKey:
+                    versionPerKey[(filename, key)] = version
+
+        analysisTasks = [(filename, version, key) for (filename, key), version in versionPerKey.items()]
+        analysisTasks.sort(key=lambda task: sizes.get((task[0], task[1]), 0), reverse=True)
+        pendingTasks = Counter(filename for filename, _, _ in analysisTasks)
+
+        sectionHashesPerKey: dict[tuple[str, AnalysisKey], dict[str, str]] = dict()
+
+        def reduceFile(filename: str) -> list[list[str]]:
+            sectionHashesPerVersion = dict()
+            for version in versionsList:
+                key = keyPerFileVersion.get((filename, version))
+                if key is not None:
+                    sectionHashesPerVersion[version] = sectionHashesPerKey[(filename, key)]
+            return makeRows(versionsList, sectionHashesPerVersion)
+
+        # Files missing from every version have nothing to analyze
+        for filename in filenames:
+            if pendingTasks[filename] == 0:
+                yield filename, reduceFile(filename)
+
+        for filename, key, sectionHashes in p.imap_unordered(analyzeInWorker, analysisTasks):
+            sectionHashesPerKey[(filename, key)] = sectionHashes
+            pendingTasks[filename] -= 1
+            if pendingTasks[filename] == 0:
+                yield filename, reduceFile(filename)
+
+
+def formatHeader(versionsList: list[str]) -> str:
+    return "File name," + ",".join(versionsList) + ",Different versions"
+
+def formatRow(row: list[str]) -> str:
+    return ",".join(row) + "," + str(countUnique(row)-1)
+
+def getJournalPath(outputPath: Path) -> Path:
+    return outputPath.with_name(outputPath.name + ".journal")
+
+def openJournal(journalPath: Path, journalHeader: dict, resume: bool) -> tuple[TextIO, dict[str, list[list[str]]]]:
+    """Opens the journal of an `--output` run, where the rows of every file are appended as soon as the file is finished.
+
+    The first line describes the run, and every other line holds the rows of
+    a single file. When resuming, the rows already in the journal are
+    returned, and a last line cut short by an interruption is dropped.
+    """
+    rowsPerFile: dict[str, list[list[str]]] = dict()
+    if resume and journalPath.exists():
+        validSize = 0
+        with journalPath.open("rb") as f:
+            for i, line in enumerate(f):
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                if i == 0:
+                    if entry != journalHeader:
+                        print(f"'{journalPath}' was written with other versions or options, run again without --resume to start over.", file=sys.stderr)
+                        sys.exit(1)
+                else:
+                    rowsPerFile[entry["file"]] = entry["rows"]
+                validSize += len(line)
+
+        if validSize > 0:
+            os.truncate(journalPath, validSize)
+            print(f"Resuming: {len(rowsPerFile)} files were already compared.", file=sys.stderr)
+            return journalPath.open("a"), rowsPerFile
+
+    journal = journalPath.open("w")
+    journal.write(json.dumps(journalHeader) + "\n")
+    journal.flush()
+    return journal, rowsPerFile
+
+def writeOutput(outputPath: Path, filenames: list[str], rowsPerFile: dict[str, list[list[str]]], versionsList: list[str], noheader: bool):
+    """Writes every row in filelist order."""
+    # Write to a temporary file first so an interruption never leaves a partial output behind
+    tempPath = outputPath.with_name(f"{outputPath.name}.{os.getpid()}.tmp")
+    with tempPath.open("w") as f:
+        if not noheader:
+            f.write(formatHeader(versionsList) + "\n")
+        for filename in filenames:
+            for row in rowsPerFile[filename]:
+                f.write(formatRow(row) + "\n")
+    os.replace(tempPath, outputPath)
+
+
+def benchTaskPickling(compareFunction: Callable[..., list[list[str]]], filesList: list[str], game: str, versionsList: list[str], args):
+    """Compares the cost of sending the work of each file to the workers when a single task carries every Context, against when every version is a task of its own and the workers build the contexts.
+
+    The second figure includes every worker building the Context of every version once, which is the cost moved out of the tasks.
+    """
+    def measure(makeTasks: Callable[[str], list[tuple]]) -> tuple[int, float]:
+        totalSize = 0
+        start = time.perf_counter()
+        for filename in filesList:
+            for task in makeTasks(filename):
+                data = pickle.dumps(task)
+                pickle.loads(data)
+                totalSize += len(data)
+        return totalSize, time.perf_counter() - start
+
+    # What each worker does the first time it analyzes a file of every version
+    start = time.perf_counter()
+    contextPerVersion = {version: buildContext(game, version) for version in versionsList}
+    setupTime = time.perf_counter() - start
+    numCores = cpu_count()
+
+    compareArguments = getCompareArguments(game, versionsList, args)
+    compareArguments["contextPerVersion"] = contextPerVersion
+    withContexts = partial(compareFunction, **compareArguments)
+
+    # Every version is analyzed, as if none of them shared a key
+    key = (hash_data(b""), hash_data(b""), hash_data(b""), -1)
+    oldSize, oldTime = measure(lambda filename: [(withContexts, (filename,))])
+    newSize, newTime = measure(lambda filename: [(analyzeInWorker, ((filename, version, key),)) for version in versionsList])
+    newTime += setupTime * numCores
+
+    files = max(len(filesList), 1)
+    print(f"{len(filesList)} files, {len(versionsList)} versions, {setupTime:.2f}s to build the contexts in each of the {numCores} workers")
+    print(f"Contexts in every task: {oldSize / files / 1024:10.2f} KiB {oldTime / files * 1000:9.3f}ms per file")
+    print(f"Contexts per worker:    {newSize / files / 1024:10.2f} KiB {newTime / files * 1000:9.3f}ms per file (x{oldTime / max(newTime, 1e-9):.1f}, building the contexts included)")
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -178,8 +530,16 @@ def main():
     parser.add_argument("--ignore-branches", help="Ignores the address of every branch, jump and jal.", action="store_true")
     parser.add_argument("--dont-remove-ptrs", help="Disable the pointer removal feature.", action="store_true")
     parser.add_argument("--disable-multiprocessing", help="", action="store_true")
+    parser.add_argument("--from-rom", help="Read the files straight from each '{game}/{game}_{version}.z64' instead of the extracted baserom folders.", action="store_true")
+    parser.add_argument("--no-cache", help="Don't read nor write the section hashes of previous runs from '.cache/section_hashes'.", action="store_true")
+    parser.add_argument("--output", help="Write the csv to this file instead of stdout. The rows of every finished file are kept in '{output}.journal' until the whole comparison is done.", type=Path)
+    parser.add_argument("--resume", help="Used with --output. Skip the files that are already in the journal of an interrupted run.", action="store_true")
+    parser.add_argument("--bench-tasks", help="Measure how long it takes to (un)pickle the task of each file when every Context is sent with it, or when each worker builds its own, and exit.", action="store_true")
     args = parser.parse_args()
 
+    if args.resume and args.output is None:
+        parser.error("--resume needs --output")
+
     spimdisasm.common.GlobalConfig.REMOVE_POINTERS = not args.dont_remove_ptrs
     spimdisasm.common.GlobalConfig.IGNORE_BRANCHES = args.ignore_branches
     if args.ignore_words:
@@ -199,52 +559,58 @@ def main():
             if version.startswith("#"):
                 continue
             versionsList.append(version.strip())
-    filesList = spimdisasm.common.Utils.readFile(args.filelist)
-
-    contextPerVersion: dict[str, spimdisasm.common.Context] = dict()
-    for version in versionsList:
-        context = spimdisasm.common.Context()
-        context.fillDefaultBannedSymbols()
-        context.globalSegment.fillLibultraSymbols()
-        context.globalSegment.fillHardwareRegs()
-        # context.globalSegment.readFunctionMap(version)
-        contextReadVariablesCsv(context, args.game, version)
-        contextReadFunctionsCsv(context, args.game, version)
-        contextPerVersion[version] = context
-
-    fileAddressesPerVersion: dict[str, dict[str, FileAddressesEntry]] = dict()
-    for version in versionsList:
-        fileAddressesPerVersion[version] = getFileAddresses(Path(args.game, version, "tables", "file_addresses.csv"))
-
-    if not args.noheader:
-        # Print csv header
-        print("File name", end="")
-        for ver in versionsList:
-            print("," + ver, end="")
-        print(",Different versions", end="")
-        print()
+    filesList = spimdisasm.common.Utils.readFile(Path(args.filelist))
 
     # compareFunction = compareFileAcrossVersions
     # if args.overlays:
     #     compareFunction = compareOverlayAcrossVersions
     compareFunction = compareOverlayAcrossVersions
 
+    if args.bench_tasks:
+        benchTaskPickling(compareFunction, filesList, args.game, versionsList, args)
+        return
+
+    filenames = [filename for filename in filesList if not filename.startswith("#")]
+
+    rowsPerFile: dict[str, list[list[str]]] = dict()
+    journal = None
+    if args.output is not None:
+        journalHeader = {"game": args.game, "versions": versionsList, "fromRom": args.from_rom, "settings": json.loads(json.dumps(getSectionHashCacheSettings()))}
+        journal, rowsPerFile = openJournal(getJournalPath(args.output), journalHeader, args.resume)
+    elif not args.noheader:
+        # Print csv header
+        print(formatHeader(versionsList))
+
+    pendingFiles = [filename for filename in dict.fromkeys(filenames) if filename not in rowsPerFile]
     if args.disable_multiprocessing:
-        for filename in filesList:
-            for row in compareFunction(filename, args.game, versionsList=versionsList, contextPerVersion=contextPerVersion, fileAddressesPerVersion=fileAddressesPerVersion, args=args):
-                # Print csv row
-                for cell in row:
-                    print(cell + ",", end="")
-                print(countUnique(row)-1)
+        compareArguments = getCompareArguments(args.game, versionsList, args)
+        results = ((filename, compareFunction(filename, **compareArguments)) for filename in pendingFiles)
     else:
         numCores = cpu_count()
-        p = Pool(numCores)
-        for column in p.imap(partial(compareFunction, game=args.game, versionsList=versionsList, contextPerVersion=contextPerVersion, fileAddressesPerVersion=fileAddressesPerVersion, args=args), filesList):
-            for row in column:
+        results = compareInParallel(pendingFiles, args.game, versionsList, numCores, args)
+
+    nextFile = 0
+    for filename, column in results:
+        rowsPerFile[filename] = column
+        if journal is not None:
+            journal.write(json.dumps({"file": filename, "rows": column}) + "\n")
+            journal.flush()
+            continue
+
+        # Print every finished file in filelist order
+        while nextFile < len(filenames) and filenames[nextFile] in rowsPerFile:
+            for row in rowsPerFile[filenames[nextFile]]:
                 # Print csv row
-                for cell in row:
-                    print(cell + ",", end="")
-                print(countUnique(row)-1)
+                print(formatRow(row))
+            nextFile += 1
+
+    if journal is not None:
+        journal.close()
+        writeOutput(args.output, filenames, rowsPerFile, versionsList, args.noheader)
+        getJournalPath(args.output).unlink()
+
+    if not args.no_cache:
+        SectionHashCache(getSectionHashCacheSettings()).trim()
 
 
 if __name__ == "__main__":
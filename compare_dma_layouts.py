@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+import sys
+import numpy as np
+
+from tools.mips.DmaTable import DmaTable
+
+
+class DmaLayouts:
+    """The dmadata of many versions, aligned by filename into (file, version) matrices."""
+
+    def __init__(self, versionsList: list[str], tablePerVersion: dict[str, DmaTable]):
+        self.versionsList = versionsList
+
+        # Names past the end of a table have no entry to read
+        namesPerVersion = {version: tablePerVersion[version].names[:len(tablePerVersion[version])] for version in versionsList}
+
+        # Every file, in the order they first appear
+        self.fileNames: list[str] = []
+        fileIndex: dict[str, int] = dict()
+        for version in versionsList:
+            for name in namesPerVersion[version]:
+                if name != "" and name not in fileIndex:
+                    fileIndex[name] = len(self.fileNames)
+                    self.fileNames.append(name)
+
+        shape = (len(self.fileNames), len(versionsList))
+        self.present = np.zeros(shape, dtype=bool)
+        self.deleted = np.zeros(shape, dtype=bool)
+        self.vromStart = np.zeros(shape, dtype=np.int64)
+        self.size = np.zeros(shape, dtype=np.int64)
+
+        for column, version in enumerate(versionsList):
+            table = tablePerVersion[version]
+            names = namesPerVersion[version]
+            named = np.zeros(len(table), dtype=bool)
+            named[:len(names)] = [name != "" for name in names]
+            rows = np.array([fileIndex[name] for name in names if name != ""], dtype=np.int64)
+            self.present[rows, column] = True
+            self.deleted[rows, column] = table.deletedMask[named]
+            self.vromStart[rows, column] = table.vromStart[named]
+            self.size[rows, column] = table.sizes[named]
+
+        # Every file is compared against the first version that has it
+        self.referenceColumn = np.argmax(self.present, axis=1)
+        rowIndices = np.arange(len(self.fileNames))
+        self.sizeDelta = self.size - self.size[rowIndices, self.referenceColumn][:, None]
+        self.offsetDelta = self.vromStart - self.vromStart[rowIndices, self.referenceColumn][:, None]
+
+        referenceDeleted = self.deleted[rowIndices, self.referenceColumn][:, None]
+        self.changed = self.present & ((self.sizeDelta != 0) | (self.offsetDelta != 0) | (self.deleted != referenceDeleted))
+        # A file that disappears after the reference version also counts as a change
+        afterReference = np.arange(len(versionsList))[None, :] > self.referenceColumn[:, None]
+        self.changed |= afterReference & ~self.present
+
+    def firstChangedIn(self, row: int) -> str:
+        columns = np.flatnonzero(self.changed[row])
+        if len(columns) == 0:
+            return ""
+        return self.versionsList[int(columns[0])]
+
+    def getCell(self, row: int, column: int, values: str) -> str:
+        if not self.present[row, column]:
+            return ""
+        if self.deleted[row, column]:
+            return "deleted"
+
+        if values == "size":
+            absolute = self.size[row, column]
+            delta = self.sizeDelta[row, column]
+        else:
+            absolute = self.vromStart[row, column]
+            delta = self.offsetDelta[row, column]
+
+        if column == self.referenceColumn[row]:
+            return f"{absolute:X}"
+        if delta == 0:
+            return "="
+        sign = "+" if delta > 0 else "-"
+        return f"{sign}{abs(delta):X}"
+
+
+def readDmaTables(game: str, versionsList: list[str], fromRom: bool) -> dict[str, DmaTable]:
+    tablePerVersion: dict[str, DmaTable] = dict()
+    for version in versionsList:
+        if fromRom:
+            from rom_archive import getRomArchive
+            archive = getRomArchive(game, version)
+            if archive is None:
+                print(f"Could not read the rom of {game} {version}", file=sys.stderr)
+                sys.exit(1)
+            tablePerVersion[version] = archive.dmaTable
+        else:
+            tablePath = Path(game, version, "tables", "dma_addresses.csv")
+            if not tablePath.exists():
+                print(f"Missing {tablePath}, extract the version first or use --from-rom", file=sys.stderr)
+                sys.exit(1)
+            tablePerVersion[version] = DmaTable.fromCsv(tablePath)
+    return tablePerVersion
+
+
+def main():
+    description = """\
+Compares the dmadata of many versions, aligning every file by name.
+
+Each cell is relative to the first version that has the file: that version
+shows the absolute value, and every other one shows the difference to it
+('=' if it is the same). Files that are deleted (0xFFFFFFFF in dmadata) are
+marked as 'deleted', and empty cells mean the version doesn't have the file.
+"""
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("game", help="Game to compare.", choices=["oot", "mm", "dnm"])
+    parser.add_argument("versionlist", help="Path to version list.")
+    parser.add_argument("--values", help="Whether the cells show the size of each file or its vrom offset. Defaults to 'size'.", choices=["size", "offset"], default="size")
+    parser.add_argument("--only-changed", help="Only print the files that changed in at least one version.", action="store_true")
+    parser.add_argument("--noheader", help="Disables the csv header.", action="store_true")
+    parser.add_argument("--from-rom", help="Read dmadata straight from each '{game}/{game}_{version}.z64' instead of 'dma_addresses.csv'.", action="store_true")
+    args = parser.parse_args()
+
+    versionsList = []
+    with open(args.versionlist) as f:
+        for version in f:
+            if version.startswith("#"):
+                continue
+            versionsList.append(version.strip())
+
+    layouts = DmaLayouts(versionsList, readDmaTables(args.game, versionsList, args.from_rom))
+
+    if not args.noheader:
+        print("File name," + ",".join(versionsList) + ",First changed in")
+
+    for row, filename in enumerate(layouts.fileNames):
+        firstChangedIn = layouts.firstChangedIn(row)
+        if args.only_changed and firstChangedIn == "":
+            continue
+        cells = [layouts.getCell(row, column, args.values) for column in range(len(versionsList))]
+        print(f"{filename}," + ",".join(cells) + f",{firstChangedIn}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ from pathlib import Path
 import spimdisasm
 
 from tools.mips.ZeldaTables import contextReadVariablesCsv, contextReadFunctionsCsv
+from rom_archive import readBaseromFile
 
 
 def print_result_different(comparison, indentation=0):
@@ -40,24 +41,21 @@ def compare_baseroms(args, filelist):
     contextReadFunctionsCsv(context_two, args.game, args.version2)
 
     for filename in filelist:
-        filepath_one = Path(args.game, args.version1, "baserom", filename)
-        filepath_two = Path(args.game, args.version2, "baserom", filename)
+        file_one_data = readBaseromFile(args.game, args.version1, filename, args.from_rom)
+        file_two_data = readBaseromFile(args.game, args.version2, filename, args.from_rom)
 
-        if not filepath_one.exists():
+        if len(file_one_data) == 0:
             missing_in_one.add(filename)
             if args.print in ("all", "missing"):
                 print(f"File {filename} does not exists in baserom.")
             continue
 
-        if not filepath_two.exists():
+        if len(file_two_data) == 0:
             missing_in_two.add(filename)
             if args.print in ("all", "missing"):
                 print(f"File {filename} does not exists in other_baserom.")
             continue
 
-        file_one_data = spimdisasm.common.Utils.readFileAsBytearray(filepath_one)
-        file_two_data = spimdisasm.common.Utils.readFileAsBytearray(filepath_two)
-
         splitsDataOne = None
         splitsDataTwo = None
         tablePath = Path(args.game, args.version1, "tables", f"files_{filename}.csv")
@@ -167,16 +165,13 @@ def compare_to_csv(args, filelist):
         context_one = spimdisasm.common.Context()
         context_two = spimdisasm.common.Context()
 
-        filepath_one = Path(args.game, args.version1, "baserom", filename)
-        filepath_two = Path(args.game, args.version2, "baserom", filename)
-
         index += 1
 
         #if args.filetype != "all" and args.filetype != filedata["type"]:
         #    continue
 
-        file_one_data = spimdisasm.common.Utils.readFileAsBytearray(filepath_one)
-        file_two_data = spimdisasm.common.Utils.readFileAsBytearray(filepath_two)
+        file_one_data = readBaseromFile(args.game, args.version1, filename, args.from_rom)
+        file_two_data = readBaseromFile(args.game, args.version2, filename, args.from_rom)
 
         equal = ""
         len_one = ""
@@ -263,6 +258,7 @@ def main():
     parser.add_argument("--ignore-words", help="A space separated list of hex numbers. Word differences will be ignored that starts in any of the provided arguments. Max value: FF", action="extend", nargs="+")
     parser.add_argument("--ignore-branches", help="Ignores the address of every branch, jump and jal.", action="store_true")
     parser.add_argument("--dont-remove-ptrs", help="Disable the pointer removal feature.", action="store_true")
+    parser.add_argument("--from-rom", help="Read the files straight from each '{game}/{game}_{version}.z64' instead of the extracted baserom folders.", action="store_true")
     parser.add_argument("--column1", help="Name for column one (baserom) in the csv.", default=None)
     parser.add_argument("--column2", help="Name for column two (other_baserom) in the csv.", default=None)
     args = parser.parse_args()
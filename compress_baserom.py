@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import mmap
+from multiprocessing import Pool, cpu_count
+from pathlib import Path
+import sys
+import time
+
+from calc_crc import calc_crc, detectCicOrDefault
+from compression import Codec, getCodec, detectCodec
+from extract_baserom import FILE_TABLE_OFFSET
+from tools.mips.DmaTable import DmaTable
+
+
+uncompressedRom: mmap.mmap | None = None
+
+
+def round_up(n, shift):
+    mod = 1 << shift
+    return (n + mod - 1) >> shift << shift
+
+def read_dmadata(rom_data, start: int) -> DmaTable:
+    return DmaTable.fromRom(rom_data, start)
+
+def initialize_worker(uncompressedPath: Path):
+    global uncompressedRom
+    with uncompressedPath.open("rb") as f:
+        uncompressedRom = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def compress_segment(task: tuple[int, int, int, str]) -> tuple[int, bytes]:
+    index, v_start, v_end, codecName = task
+    assert uncompressedRom is not None
+    return index, getCodec(codecName).compress(uncompressedRom[v_start:v_end])
+
+def detect_rom_codec(original: bytes, dmadata: DmaTable) -> Codec:
+    # Every compressed file of a rom uses the same codec, so the first one is enough
+    compressedIndices = dmadata.compressedMask.nonzero()[0]
+    if len(compressedIndices) == 0:
+        print("The original rom does not have any compressed file.")
+        sys.exit(1)
+    _, _, p_start, p_end = dmadata[int(compressedIndices[0])]
+    codec = detectCodec(original[p_start:p_end])
+    if codec is None:
+        print(f"Could not detect the compression used by the file at 0x{p_start:X}.")
+        sys.exit(1)
+    return codec
+
+def compress_rom(original: bytes, uncompressedPath: Path, dmadata_addr: int, num_cores: int) -> bytearray:
+    dmadata = read_dmadata(original, dmadata_addr)
+    codec = detect_rom_codec(original, dmadata)
+
+    tasks = []
+    for i in dmadata.compressedMask.nonzero()[0].tolist():
+        v_start, v_end, _, _ = dmadata[i]
+        tasks.append((i, v_start, v_end, codec.name))
+
+    # Biggest segments first, so the slow ones don't end up last
+    tasks.sort(key=lambda task: task[2] - task[1], reverse=True)
+
+    compressedSegments: dict[int, bytes] = dict()
+    print(f"Compressing {len(tasks)} segments as {codec.name} ({codec.backendName}) with {num_cores} processes...")
+    if num_cores > 1:
+        with Pool(num_cores, initialize_worker, (uncompressedPath,)) as p:
+            for index, data in p.imap_unordered(compress_segment, tasks):
+                compressedSegments[index] = data
+    else:
+        initialize_worker(uncompressedPath)
+        for task in tasks:
+            index, data = compress_segment(task)
+            compressedSegments[index] = data
+
+    with uncompressedPath.open("rb") as f:
+        uncompressed = f.read()
+
+    # Lay out the segments in dmadata order, rebuilding the table on the way
+    compressed = bytearray()
+    new_dmadata = dmadata.entries.copy()
+    for i, (v_start, v_end, p_start, p_end) in enumerate(dmadata):
+        if p_start == 0xFFFFFFFF and p_end == 0xFFFFFFFF:
+            continue
+
+        new_p_start = len(compressed)
+        if i in compressedSegments:
+            compressed.extend(compressedSegments[i])
+            compressed.extend(bytes(round_up(len(compressed), 4) - len(compressed)))
+            new_p_end = len(compressed)
+        else:
+            compressed.extend(uncompressed[v_start:v_end])
+            compressed.extend(bytes(round_up(len(compressed), 4) - len(compressed)))
+            new_p_end = 0
+        new_dmadata[i] = (v_start, v_end, new_p_start, new_p_end)
+
+    compressed[dmadata_addr:dmadata_addr + new_dmadata.nbytes] = new_dmadata.tobytes()
+
+    # Pad to the size of the original rom with its filler byte
+    if len(compressed) < len(original):
+        compressed.extend(bytes([original[-1]]) * (len(original) - len(compressed)))
+
+    print("Recalculating crc...")
+    cic_type = detectCicOrDefault(compressed)
+    compressed[0x10:0x18] = calc_crc(compressed, cic_type)
+
+    return compressed
+
+
+def main():
+    description = "Recompress an uncompressed rom, using the dmadata of the original rom to know which files were compressed."
+
+    edition_choices = {
+        "oot": ", ".join(x.lower().replace(" ", "_") for x in FILE_TABLE_OFFSET["OOT"]),
+        "mm": ", ".join(x.lower().replace(" ", "_") for x in FILE_TABLE_OFFSET["MM"]),
+        "dnm": ", ".join(x.lower().replace(" ", "_") for x in FILE_TABLE_OFFSET["DNM"]),
+    }
+    epilog = f"""\
+Each `game` has different versions, and hence different edition options.
+    For oot: {edition_choices["oot"]}
+    For mm:  {edition_choices["mm"]}
+    For dnm: {edition_choices["dnm"]}
+
+For details on what these abbreviations mean, see the README.md.
+    """
+    parser = argparse.ArgumentParser(description=description, epilog=epilog, formatter_class=argparse.RawTextHelpFormatter)
+    choices = ["oot", "mm", "dnm"]
+    parser.add_argument("game", help="Game to compress.", choices=choices)
+    parser.add_argument("edition", help="Version of the game to compress.")
+    parser.add_argument("-o", "--output", help="Path of the compressed rom. Defaults to '{game}/{game}_{version}_recompressed.z64'.", type=Path)
+    parser.add_argument("-j", help="Number of processes used to compress the segments. Defaults to every CPU core.", type=int, default=cpu_count())
+    args = parser.parse_args()
+
+    Game      = args.game.upper()
+    Edition   = args.edition
+    Version   = Edition.upper().replace("_", " ")
+
+    if Version not in FILE_TABLE_OFFSET[Game]:
+        print(f"The selected edition '{Edition}' is not a valid option for the game '{args.game}'")
+        sys.exit(1)
+
+    originalPath = Path(args.game, f"{args.game}_{Edition}.z64")
+    uncompressedPath = Path(args.game, f"{args.game}_{Edition}_uncompressed.z64")
+    outputPath = args.output
+    if outputPath is None:
+        outputPath = Path(args.game, f"{args.game}_{Edition}_recompressed.z64")
+
+    for path in (originalPath, uncompressedPath):
+        if not path.exists():
+            print(f"Could not find '{path}'.")
+            sys.exit(1)
+
+    original = originalPath.read_bytes()
+
+    start = time.perf_counter()
+    compressed = compress_rom(original, uncompressedPath, FILE_TABLE_OFFSET[Game][Version], max(1, args.j))
+    print(f"Compressed in {time.perf_counter() - start:.2f}s.")
+
+    print(f"Writing new ROM {outputPath}.")
+    outputPath.write_bytes(compressed)
+
+    print("Done!")
+
+
+if __name__ == "__main__":
+    main()
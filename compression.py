@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import random
+import struct
+import time
+from typing import Callable, Iterable
+import zlib
+import libyaz0
+
+try:
+    import crunch64
+except ImportError:
+    crunch64 = None
+
+
+class Codec:
+    """A compression format used by the files of a rom.
+
+    Every codec may have more than one backend available, the first one in
+    `backends` is the preferred one, and it is the one used by default.
+    """
+
+    name: str = ""
+
+    def __init__(self):
+        self.backends: dict[str, tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = dict()
+        self.backendName = ""
+
+    def addBackend(self, name: str, decompressFunc: Callable[[bytes], bytes], compressFunc: Callable[[bytes], bytes]):
+        self.backends[name] = (decompressFunc, compressFunc)
+        if self.backendName == "":
+            self.backendName = name
+
+    def setBackend(self, name: str):
+        assert name in self.backends, f"Unknown backend '{name}' for codec '{self.name}'"
+        self.backendName = name
+
+    def matches(self, data) -> bool:
+        return False
+
+    def decompress(self, data) -> bytes:
+        return self.backends[self.backendName][0](data)
+
+    def compress(self, data) -> bytes:
+        return self.backends[self.backendName][1](data)
+
+    def decompressBatch(self, segments: Iterable) -> list[bytes]:
+        decompressFunc = self.backends[self.backendName][0]
+        return [decompressFunc(data) for data in segments]
+
+
+class Yaz0Codec(Codec):
+    name = "yaz0"
+
+    def __init__(self):
+        super().__init__()
+        if crunch64 is not None:
+            self.addBackend("crunch64", lambda data: crunch64.yaz0.decompress(bytes(data)), lambda data: crunch64.yaz0.compress(bytes(data)))
+        self.addBackend("libyaz0", libyaz0.decompress, libyaz0.compress)
+
+    def matches(self, data) -> bool:
+        return bytes(data[0:4]) == b"Yaz0"
+
+
+class DeflateCodec(Codec):
+    """Raw deflate streams (no zlib header), as used by the iQue versions."""
+
+    name = "deflate"
+
+    def __init__(self):
+        super().__init__()
+        self.addBackend("zlib", self.decompressZlib, self.compressZlib)
+
+    def decompressZlib(self, data) -> bytes:
+        decomp = zlib.decompressobj(-zlib.MAX_WBITS)
+        output = bytearray()
+        output.extend(decomp.decompress(data))
+        while decomp.unconsumed_tail:
+            output.extend(decomp.decompress(decomp.unconsumed_tail))
+        output.extend(decomp.flush())
+        return bytes(output)
+
+    def compressZlib(self, data) -> bytes:
+        comp = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return comp.compress(data) + comp.flush()
+
+    def matches(self, data) -> bool:
+        if len(data) == 0:
+            return False
+        # Block type 3 is reserved, so it can't be the first block of a valid stream
+        if (data[0] >> 1) & 3 == 3:
+            return False
+        try:
+            zlib.decompressobj(-zlib.MAX_WBITS).decompress(bytes(data[0:0x100]), 0x100)
+        except zlib.error:
+            return False
+        return True
+
+
+class StoredCodec(Codec):
+    """Uncompressed data."""
+
+    name = "stored"
+
+    def __init__(self):
+        super().__init__()
+        self.addBackend("copy", bytes, bytes)
+
+    def matches(self, data) -> bool:
+        return True
+
+
+CODECS: dict[str, Codec] = {codec.name: codec for codec in (Yaz0Codec(), DeflateCodec(), StoredCodec())}
+
+# Order in which the codecs are tried when detecting the format of a compressed file.
+# `stored` is not included since a compressed file can't be uncompressed.
+DETECTION_ORDER = ["yaz0", "deflate"]
+
+
+def getCodec(name: str) -> Codec:
+    return CODECS[name]
+
+def detectCodec(data) -> Codec | None:
+    for name in DETECTION_ORDER:
+        codec = CODECS[name]
+        if codec.matches(data):
+            return codec
+    return None
+
+def detectCodecOrFail(data) -> Codec:
+    codec = detectCodec(data)
+    if codec is None:
+        raise ValueError(f"Unknown compression format (starts with {bytes(data[0:8]).hex()})")
+    return codec
+
+def decompress(data) -> bytes:
+    return detectCodecOrFail(data).decompress(data)
+
+
+def benchmark(size: int, segmentCount: int, iterations: int):
+    rng = random.Random(0)
+    words = [rng.choice([0, 0x27BDFFE8, 0x03E00008, rng.getrandbits(32)]) for _ in range(size // 4)]
+    data = struct.pack(f">{len(words)}I", *words)
+
+    for codec in CODECS.values():
+        for backendName in codec.backends:
+            codec.setBackend(backendName)
+            compressed = codec.compress(data)
+            segments = [compressed] * segmentCount
+            assert codec.decompress(compressed) == data, f"{codec.name}/{backendName}: round trip failed"
+            assert codec is CODECS["stored"] or detectCodec(compressed) is codec, f"{codec.name}: not detected"
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for segment in segments:
+                    codec.decompress(segment)
+            singleTime = (time.perf_counter() - start) / iterations
+
+            start = time.perf_counter()
+            for _ in range(iterations):
+                codec.decompressBatch(segments)
+            batchTime = (time.perf_counter() - start) / iterations
+
+            totalSize = size * segmentCount / (1024 * 1024)
+            print(f"{codec.name:<8} {backendName:<9} ratio {len(compressed)/size:5.3f}  single: {singleTime*1000:9.2f}ms ({totalSize/singleTime:8.2f}MiB/s)  batch: {batchTime*1000:9.2f}ms ({totalSize/batchTime:8.2f}MiB/s)")
+        codec.setBackend(next(iter(codec.backends)))
+
+def main():
+    description = "Compression codecs used by the Zelda64 roms. Running it benchmarks every available codec and backend."
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--size", help="Size of each benchmarked segment. Defaults to 0x4000.", default="0x4000")
+    parser.add_argument("--segments", help="Amount of segments decompressed per iteration. Defaults to 64.", type=int, default=64)
+    parser.add_argument("--iterations", help="Defaults to 3.", type=int, default=3)
+    args = parser.parse_args()
+
+    benchmark(int(args.size, 0), args.segments, args.iterations)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import hashlib
+
+
+def hash_data(data) -> str:
+    """Hash of the contents of a file, as written in the manifests and used to name the store objects and cache entries."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
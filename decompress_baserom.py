@@ -1,27 +1,25 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import argparse
-import hashlib, io, struct, sys
-import libyaz0
+import collections
+import hashlib, struct, sys
+import mmap
+from multiprocessing import Pool, cpu_count
 from pathlib import Path
-import zlib
+from typing import Iterator
 
+from calc_crc import calc_crc, detectCicOrDefault
+from compression import detectCodecOrFail
+from decompression_cache import DecompressionCache, decompressBatchMaybeCached, decompressMaybeCached
 from extract_baserom import FILE_TABLE_OFFSET
-from fixbaserom import VERSIONS_MD5S
-
-def decompressZlib(data: bytes) -> bytes:
-    decomp = zlib.decompressobj(-zlib.MAX_WBITS)
-    output = bytearray()
-    output.extend(decomp.decompress(data))
-    while decomp.unconsumed_tail:
-        output.extend(decomp.decompress(decomp.unconsumed_tail))
-    output.extend(decomp.flush())
-    return bytes(output)
-
-def decompress(data: bytes, is_zlib_compressed: bool) -> bytes:
-    if is_zlib_compressed:
-        return decompressZlib(data)
-    return libyaz0.decompress(data)
+from fixbaserom import VERSIONS_MD5S, wordSwapFile, byteSwapFile, getRomIdentity
+from tools.mips.DmaTable import DmaTable
+
+def decompress(data: bytes) -> bytes:
+    codec = detectCodecOrFail(data)
+    return decompressMaybeCached(decompressionCache, codec.name, data, codec.decompress)
 
 description = "Convert a rom that uses dmadata to an uncompressed one."
 
@@ -38,27 +36,12 @@ For dnm: {edition_choices["dnm"]}
 
 For details on what these abbreviations mean, see the README.md.
 """
-parser = argparse.ArgumentParser(description=description, epilog=epilog, formatter_class=argparse.RawTextHelpFormatter)
-choices = ["oot", "mm", "dnm"]
-parser.add_argument("game", help="Game to extract.", choices=choices)
-parser.add_argument("edition", help="Version of the game to extract.")
-
-args = parser.parse_args()
-
-BASEROM_PATH = Path(args.game, args.game + "_" + args.edition + ".z64")
-UNCOMPRESSED_PATH = Path(args.game, args.game + "_" + args.edition + "_uncompressed.z64")
-
-
-Game      = args.game.upper()
-Edition   = args.edition
-Version   = Edition.upper().replace("_", " ")
-
-file_table_offset = FILE_TABLE_OFFSET[Game][Version]
-correct_str_hash = VERSIONS_MD5S[Game][Version]
-
-
-# UNCOMPRESSED_SIZE = 0x2F00000 # OoT debug
 
+Edition = ""
+fileContent = bytearray()
+DECOMPRESSION_BATCH_COUNT = 16
+DECOMPRESSION_BATCH_SIZE = 0x40000
+decompressionCache: DecompressionCache | None = None
 
 
 def round_up(n,shift):
@@ -68,198 +51,251 @@ def round_up(n,shift):
 def as_word(b, off=0):
     return struct.unpack(">I", b[off:off+4])[0]
 
-def as_word_list(b):
-    return [i[0] for i in struct.iter_unpack(">I",  b)]
+def read_dmadata(start) -> DmaTable:
+    return DmaTable.fromRom(fileContent, start)
 
-def calc_crc(rom_data, cic_type):
-    start = 0x1000
-    end = 0x101000
+def update_crc(decompressed: bytearray) -> bytearray:
+    print("Recalculating crc...")
+    cic_type = detectCicOrDefault(decompressed)
+    new_crc = calc_crc(decompressed, cic_type)
 
-    unsigned_long = lambda i: i & 0xFFFFFFFF
-    rol = lambda i, b: unsigned_long(i << b) | (i >> (-b & 0x1F))
+    decompressed[0x10:0x18] = new_crc
+    return decompressed
 
-    if cic_type == 6101 or cic_type == 6102:
-        seed = 0xF8CA4DDC
-    elif cic_type == 6103:
-        seed = 0xA3886759
-    elif cic_type == 6105:
-        seed = 0xDF26F436
-    elif cic_type == 6106:
-        seed = 0x1FEA617A
+def initialize_worker(cache: DecompressionCache | None):
+    global decompressionCache
+    decompressionCache = cache
+
+def decompress_segments(batch: list[tuple[int, bytes]]) -> list[tuple[int, bytes]]:
+    return decompressBatchMaybeCached(decompressionCache, batch)
+
+def make_batches(tasks: list[tuple[int, int, int]]) -> Iterator[list[tuple[int, bytes]]]:
+    """Groups the compressed segments in batches, to cut down the IPC overhead of the tiny ones."""
+    batch = []
+    batch_size = 0
+    for v_start, p_start, p_end in tasks:
+        batch.append((v_start, bytes(fileContent[p_start:p_end])))
+        batch_size += p_end - p_start
+        if len(batch) >= DECOMPRESSION_BATCH_COUNT or batch_size >= DECOMPRESSION_BATCH_SIZE:
+            yield batch
+            batch = []
+            batch_size = 0
+    if len(batch) > 0:
+        yield batch
+
+def get_decompressed_size(dmadata: DmaTable) -> int:
+    size = round_up(dmadata[-1][1], 14)
+    present = ~dmadata.deletedMask
+    if present.any():
+        size = max(size, int(dmadata.vromEnd[present].max()))
+    return size
+
+def decompress_rom(dmadata_addr, dmadata: DmaTable, num_cores: int = 1, decompressed=None):
+    # new dmadata: {vrom start , vrom end , vrom start , 0}, deleted files are kept as they are
+    new_dmadata = dmadata.entries.copy()
+    present = ~dmadata.deletedMask
+    new_dmadata["romStart"][present] = dmadata.vromStart[present]
+    new_dmadata["romEnd"][present] = 0
+
+    # `decompressed` may be a zero-filled buffer provided by the caller, like an mmap'd output file
+    if decompressed is None:
+        decompressed = bytearray(get_decompressed_size(dmadata))
+    output = memoryview(decompressed)
+
+    def write_segment(v_start: int, data):
+        output[v_start:v_start + len(data)] = data
+
+    tasks = [] # compressed segments: (vrom start, rom start, rom end)
+    for v_start, v_end, p_start, p_end in dmadata:
+        if p_start == 0xFFFFFFFF and p_end == 0xFFFFFFFF:
+            continue
+        if p_end == 0: # uncompressed
+            write_segment(v_start, fileContent[p_start:p_start + v_end - v_start])
+        else: # compressed
+            tasks.append((v_start, p_start, p_end))
+
+    # Decompress the segments straight into their vrom offset
+    if num_cores > 1:
+        # Bound the amount of batches in flight so they don't pile up in memory.
+        # The batches are made lazily, so only the ones in flight hold a copy of their segments
+        max_in_flight = num_cores * 4
+        pending = collections.deque()
+        with Pool(num_cores, initialize_worker, (decompressionCache,)) as p:
+            for batch in make_batches(tasks):
+                pending.append(p.apply_async(decompress_segments, (batch,)))
+                if len(pending) >= max_in_flight:
+                    for segment in pending.popleft().get():
+                        write_segment(*segment)
+            while pending:
+                for segment in pending.popleft().get():
+                    write_segment(*segment)
     else:
-        assert False , f"Unknown cic type: {cic_type}"
+        for v_start, p_start, p_end in tasks:
+            write_segment(v_start, decompress(fileContent[p_start:p_end]))
 
-    t1 = t2 = t3 = t4 = t5 = t6 = seed
+    output.release()
 
-    for pos in range(start, end, 4):
-        d = as_word(rom_data, pos)
-        r = rol(d, d & 0x1F)
+    # write new dmadata
+    decompressed[dmadata_addr:dmadata_addr + new_dmadata.nbytes] = new_dmadata.tobytes()
+    # re-calculate crc
+    return update_crc(decompressed)
 
-        t6d = unsigned_long(t6 + d)
-        if t6d < t6:
-            t4 = unsigned_long(t4 + 1)
-        t6 = t6d
-        t3 ^= d
-        t5 = unsigned_long(t5 + r)
 
-        if t2 > d:
-            t2 ^= r
-        else:
-            t2 ^= t6 ^ d
+def map_rom(romFileName: Path) -> mmap.mmap:
+    with romFileName.open(mode="rb") as file:
+        needsSwap = file.read(1) in (b"\x40", b"\x37")
+        if needsSwap:
+            # Swapping has to modify the data, so the pages end up copied into memory anyway
+            print("ROM is not big-endian, it will be swapped in memory. Run fixbaserom.py first to avoid this.")
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
 
-        if cic_type == 6105:
-            t1 = unsigned_long(t1 + (as_word(rom_data, 0x0750 + (pos & 0xFF)) ^ d))
+def write_rom_low_memory(outPath: Path, file_table_offset: int, dmadata, is_compressed: bool, padding_start: int, padding_end: int, num_cores: int):
+    """Writes the new rom straight into an mmap'd output file, without keeping a copy of it in memory."""
+    if is_compressed:
+        size = get_decompressed_size(dmadata)
+    else:
+        size = max(len(fileContent), padding_end)
+
+    print(f"Writing new ROM {outPath}.")
+    with outPath.open("w+b") as file:
+        file.truncate(size)
+        output = mmap.mmap(file.fileno(), size)
+
+        if is_compressed:
+            print("Decompressing rom...")
+            decompress_rom(file_table_offset, dmadata, num_cores, output)
+            if decompressionCache is not None:
+                decompressionCache.trim()
+            print(f"{size:X}")
         else:
-            t1 = unsigned_long(t1 + (t5 ^ d))
+            chunkSize = 0x100000
+            for offset in range(0, len(fileContent), chunkSize):
+                output[offset:offset+chunkSize] = fileContent[offset:offset+chunkSize]
 
-    chksum = [0,0]
+        print(f"Padding from {padding_start:X} to {padding_end:X}...")
+        output[padding_start:padding_end] = b"\xFF" * (padding_end - padding_start)
 
-    if cic_type == 6103:
-        chksum[0] = unsigned_long((t6 ^ t4) + t3)
-        chksum[1] = unsigned_long((t5 ^ t2) + t1)
-    elif cic_type == 6106:
-        chksum[0] = unsigned_long((t6 * t4) + t3)
-        chksum[1] = unsigned_long((t5 * t2) + t1)
-    else:
-        chksum[0] = t6 ^ t4 ^ t3
-        chksum[1] = t5 ^ t2 ^ t1
-
-    return struct.pack(">II", chksum[0], chksum[1])
-
-def read_dmadata_entry(addr):
-    return as_word_list(fileContent[addr:addr+0x10])
-
-def read_dmadata(start):
-    dmadata = []
-    addr = start
-    entry = read_dmadata_entry(addr)
-    i = 0
-    while any([e != 0 for e in entry]):
-        # print(f"0x{addr:08X} " + str([f"{e:08X}" for e in entry]))
-        dmadata.append(entry)
-        addr += 0x10
-        i += 1
-        entry = read_dmadata_entry(addr)
-    # print(f"0x{addr:08X} " + str([f"{e:08X}" for e in entry]))
-    return dmadata
-
-def update_crc(decompressed):
-    print("Recalculating crc...")
-    new_crc = calc_crc(decompressed.getbuffer(), 6105)
+        output.flush()
+        output.close()
 
-    decompressed.seek(0x10)
-    decompressed.write(new_crc)
-    return decompressed
+def get_str_hash(byte_array):
+    return str(hashlib.md5(byte_array).hexdigest())
 
-def decompress_rom(dmadata_addr, dmadata):
-    rom_segments = {} # vrom start : data s.t. len(data) == vrom_end - vrom_start
-    new_dmadata = bytearray() # new dmadata: {vrom start , vrom end , vrom start , 0}
+def main():
+    global Edition
+    global fileContent
+    global decompressionCache
 
-    decompressed = io.BytesIO(b"")
+    parser = argparse.ArgumentParser(description=description, epilog=epilog, formatter_class=argparse.RawTextHelpFormatter)
+    choices = ["oot", "mm", "dnm"]
+    parser.add_argument("game", help="Game to extract.", choices=choices)
+    parser.add_argument("edition", help="Version of the game to extract.")
+    parser.add_argument("-j", help="Number of processes used to decompress the segments. Defaults to every CPU core.", type=int, default=cpu_count())
+    parser.add_argument("--no-cache", help="Don't use the shared decompression cache.", action="store_true")
+    parser.add_argument("--low-memory", help="Map the input rom instead of reading it, and stream the decompressed segments straight into the output file.", action="store_true")
 
-    for v_start, v_end, p_start, p_end in dmadata:
-        if p_start == 0xFFFFFFFF and p_end == 0xFFFFFFFF:
-            new_dmadata.extend(struct.pack(">IIII", v_start, v_end, p_start, p_end))
-            continue
-        if p_end == 0: # uncompressed
-            rom_segments.update({v_start : fileContent[p_start:p_start + v_end - v_start]})
-        else: # compressed
-            rom_segments.update({v_start : decompress(fileContent[p_start:p_end], Edition in {"iqs", "iqt", "cn"})})
-        new_dmadata.extend(struct.pack(">IIII", v_start, v_end, v_start, 0))
+    args = parser.parse_args()
 
-    # write rom segments to vaddrs
-    for vrom_st,data in rom_segments.items():
-        decompressed.seek(vrom_st)
-        decompressed.write(data)
-    # write new dmadata
-    decompressed.seek(dmadata_addr)
-    decompressed.write(new_dmadata)
-    # pad to size
-    padding_end = round_up(dmadata[-1][1], 14)
-    decompressed.seek(padding_end-1)
-    decompressed.write(bytearray([0]))
-    # re-calculate crc
-    return update_crc(decompressed)
+    BASEROM_PATH = Path(args.game, args.game + "_" + args.edition + ".z64")
+    UNCOMPRESSED_PATH = Path(args.game, args.game + "_" + args.edition + "_uncompressed.z64")
 
 
-def get_str_hash(byte_array):
-    return str(hashlib.md5(byte_array).hexdigest())
+    Game      = args.game.upper()
+    Edition   = args.edition
+    Version   = Edition.upper().replace("_", " ")
 
-# If the baserom exists and is correct, we don't need to change anything
-if UNCOMPRESSED_PATH.exists():
-    with UNCOMPRESSED_PATH.open(mode="rb") as file:
-        fileContent = bytearray(file.read())
-        if get_str_hash(fileContent) == correct_str_hash:
+    if not args.no_cache:
+        decompressionCache = DecompressionCache()
+
+    file_table_offset = FILE_TABLE_OFFSET[Game][Version]
+    correct_str_hash = VERSIONS_MD5S[Game][Version]
+
+
+    # UNCOMPRESSED_SIZE = 0x2F00000 # OoT debug
+
+    # If the baserom exists and is correct, we don't need to change anything
+    if UNCOMPRESSED_PATH.exists():
+        if getRomIdentity(UNCOMPRESSED_PATH)["md5"] == correct_str_hash:
             print("Found valid baserom - exiting early")
             sys.exit(0)
 
-# Determine if we have a ROM file
-romFileName = BASEROM_PATH
-# if path.exists("baserom.mm.us.rev1.z64"):
-#     romFileName = "baserom.mm.us.rev1.z64"
-# elif path.exists("baserom.mm.us.rev1.n64"):
-#     romFileName = "baserom.mm.us.rev1.n64"
-# elif path.exists("baserom.mm.us.rev1.v64"):
-#     romFileName = "baserom.mm.us.rev1.v64"
-# else:
-#     print("Error: Could not find baserom.mm.us.rev1.z64/baserom.mm.us.rev1.n64/baserom.mm.us.rev1.v64.")
-#     sys.exit(1)
-
-# Read in the original ROM
-print(f"File '{str(romFileName)}' found.")
-with romFileName.open(mode="rb") as file:
-    fileContent = bytearray(file.read())
-
-fileContentLen = len(fileContent)
-
-# Check if ROM needs to be byte/word swapped
-# Little-endian
-if fileContent[0] == 0x40:
-    # Word Swap ROM
-    print("ROM needs to be word swapped...")
-    words = str(int(fileContentLen/4))
-    little_byte_format = "<" + words + "I"
-    big_byte_format = ">" + words + "I"
-    tmp = struct.unpack_from(little_byte_format, fileContent, 0)
-    struct.pack_into(big_byte_format, fileContent, 0, *tmp)
-
-    print("Word swapping done.")
-
-# Byte-swapped
-elif fileContent[0] == 0x37:
-    # Byte Swap ROM
-    print("ROM needs to be byte swapped...")
-    halfwords = str(int(fileContentLen/2))
-    little_byte_format = "<" + halfwords + "H"
-    big_byte_format = ">" + halfwords + "H"
-    tmp = struct.unpack_from(little_byte_format, fileContent, 0)
-    struct.pack_into(big_byte_format, fileContent, 0, *tmp)
-
-    print("Byte swapping done.")
-
-dmadata = read_dmadata(file_table_offset)
-# Decompress
-if any([b != 0 for b in fileContent[file_table_offset + 0xAC:file_table_offset + 0xAC + 0x4]]):
-    print("Decompressing rom...")
-    fileContent = decompress_rom(file_table_offset, dmadata).getbuffer()
-    print(f"{len(fileContent):X}")
-
-padding_start = round_up(dmadata[-1][1], 12)
-padding_end = round_up(dmadata[-1][1], 14)
-print(f"Padding from {padding_start:X} to {padding_end:X}...")
-for i in range(padding_start,padding_end):
-    fileContent[i] = 0xFF
-
-# Check to see if the ROM is a "vanilla" ROM
-# str_hash = get_str_hash(bytearray(fileContent))
-# if str_hash != correct_str_hash:
-#     print("Error: Expected a hash of " + correct_str_hash + " but got " + str_hash + ". " +
-#           "The baserom has probably been tampered, find a new one")
-#     sys.exit(1)
-
-# Write out our new ROM
-print(f"Writing new ROM {UNCOMPRESSED_PATH}.")
-with UNCOMPRESSED_PATH.open("wb") as file:
-    file.write(bytes(fileContent))
-
-print("Done!")
+    # Determine if we have a ROM file
+    romFileName = BASEROM_PATH
+    # if path.exists("baserom.mm.us.rev1.z64"):
+    #     romFileName = "baserom.mm.us.rev1.z64"
+    # elif path.exists("baserom.mm.us.rev1.n64"):
+    #     romFileName = "baserom.mm.us.rev1.n64"
+    # elif path.exists("baserom.mm.us.rev1.v64"):
+    #     romFileName = "baserom.mm.us.rev1.v64"
+    # else:
+    #     print("Error: Could not find baserom.mm.us.rev1.z64/baserom.mm.us.rev1.n64/baserom.mm.us.rev1.v64.")
+    #     sys.exit(1)
+
+    # Read in the original ROM
+    print(f"File '{str(romFileName)}' found.")
+    if args.low_memory:
+        fileContent = map_rom(romFileName)
+    else:
+        with romFileName.open(mode="rb") as file:
+            fileContent = bytearray(file.read())
+
+    fileContentLen = len(fileContent)
+
+    # Check if ROM needs to be byte/word swapped
+    # Little-endian
+    if fileContent[0] == 0x40:
+        # Word Swap ROM
+        print("ROM needs to be word swapped...")
+        wordSwapFile(fileContent)
+
+        print("Word swapping done.")
+
+    # Byte-swapped
+    elif fileContent[0] == 0x37:
+        # Byte Swap ROM
+        print("ROM needs to be byte swapped...")
+        byteSwapFile(fileContent)
+
+        print("Byte swapping done.")
+
+    dmadata = read_dmadata(file_table_offset)
+    is_compressed = any([b != 0 for b in fileContent[file_table_offset + 0xAC:file_table_offset + 0xAC + 0x4]])
+
+    padding_start = round_up(dmadata[-1][1], 12)
+    padding_end = round_up(dmadata[-1][1], 14)
+
+    if args.low_memory:
+        write_rom_low_memory(UNCOMPRESSED_PATH, file_table_offset, dmadata, is_compressed, padding_start, padding_end, args.j)
+        fileContent.close()
+        print("Done!")
+        return
+
+    # Decompress
+    if is_compressed:
+        print("Decompressing rom...")
+        fileContent = decompress_rom(file_table_offset, dmadata, args.j)
+        if decompressionCache is not None:
+            decompressionCache.trim()
+        print(f"{len(fileContent):X}")
+
+    print(f"Padding from {padding_start:X} to {padding_end:X}...")
+    fileContent[padding_start:padding_end] = b"\xFF" * (padding_end - padding_start)
+
+    # Check to see if the ROM is a "vanilla" ROM
+    # str_hash = get_str_hash(bytearray(fileContent))
+    # if str_hash != correct_str_hash:
+    #     print("Error: Expected a hash of " + correct_str_hash + " but got " + str_hash + ". " +
+    #           "The baserom has probably been tampered, find a new one")
+    #     sys.exit(1)
+
+    # Write out our new ROM
+    print(f"Writing new ROM {UNCOMPRESSED_PATH}.")
+    with UNCOMPRESSED_PATH.open("wb") as file:
+        file.write(fileContent)
+
+    print("Done!")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, TypeVar
+
+from compression import Codec, detectCodecOrFail
+from disk_lru_cache import DiskLruCache, cacheMain
+
+
+DEFAULT_CACHE_DIR = Path(".cache", "decompressed")
+DEFAULT_CACHE_MAX_SIZE = 2 * 1024 * 1024 * 1024 # 2 GiB
+
+
+class DecompressionCache(DiskLruCache):
+    """On-disk cache of decompressed segments, keyed by a hash of the compressed bytes and the codec.
+
+    Identical compressed files are shared between versions (and between
+    `extract_baserom.py` and `decompress_baserom.py`), so they only need to
+    be decompressed once.
+    """
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, maxSize: int = DEFAULT_CACHE_MAX_SIZE):
+        super().__init__(directory, maxSize)
+
+    def getEntryPath(self, codec: str, compressed) -> Path:
+        return self.getKeyPath(compressed, codec)
+
+    def get(self, codec: str, compressed) -> bytes | None:
+        return self.readEntry(self.getEntryPath(codec, compressed))
+
+    def put(self, codec: str, compressed, decompressed):
+        self.writeEntry(self.getEntryPath(codec, compressed), decompressed)
+
+    def decompress(self, codec: str, compressed, decompressFunc: Callable[[bytes], bytes]) -> bytes:
+        data = self.get(codec, compressed)
+        if data is None:
+            data = decompressFunc(compressed)
+            self.put(codec, compressed, data)
+        return data
+
+
+def decompressMaybeCached(cache: DecompressionCache | None, codec: str, compressed, decompressFunc: Callable[[bytes], bytes]) -> bytes:
+    if cache is None:
+        return decompressFunc(compressed)
+    return cache.decompress(codec, compressed, decompressFunc)
+
+
+T = TypeVar("T")
+
+def decompressBatchMaybeCached(cache: DecompressionCache | None, segments: list[tuple[T, bytes]]) -> list[tuple[T, bytes]]:
+    """Decompresses many `(key, compressed data)` segments at once, detecting the codec of each one.
+
+    Segments missing from the cache are grouped per codec and decompressed
+    with `Codec.decompressBatch`. The order of the result is not preserved.
+    """
+    results: list[tuple[T, bytes]] = []
+    misses: dict[Codec, list[tuple[T, bytes]]] = dict()
+
+    for key, data in segments:
+        codec = detectCodecOrFail(data)
+        cached = cache.get(codec.name, data) if cache is not None else None
+        if cached is not None:
+            results.append((key, cached))
+        else:
+            misses.setdefault(codec, []).append((key, data))
+
+    for codec, codecSegments in misses.items():
+        decompressedList = codec.decompressBatch(data for _, data in codecSegments)
+        for (key, data), decompressed in zip(codecSegments, decompressedList):
+            if cache is not None:
+                cache.put(codec.name, data, decompressed)
+            results.append((key, decompressed))
+
+    return results
+
+
+def main():
+    cacheMain("Shows the size of the decompression cache, or trims it.", DecompressionCache, DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_SIZE)
+
+if __name__ == "__main__":
+    main()
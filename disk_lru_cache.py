@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+from typing import Callable
+
+from data_hash import hash_data
+
+
+class DiskLruCache:
+    """Base of the on-disk caches, evicted by size in least recently used order.
+
+    Every entry is a single file named after a hash of its key, whose mtime
+    is used as its last access time, so `trim` can evict the least recently
+    used entries once the cache grows past `maxSize`. Subclasses only decide
+    what the key is and how the values are stored.
+    """
+
+    def __init__(self, directory: Path, maxSize: int):
+        self.directory = Path(directory)
+        self.maxSize = maxSize
+
+    def getKeyPath(self, keyData, *subdirectories: str) -> Path:
+        keyHash = hash_data(keyData)
+        return self.directory.joinpath(*subdirectories, keyHash[:2], keyHash)
+
+    def readEntry(self, entryPath: Path) -> bytes | None:
+        try:
+            data = entryPath.read_bytes()
+        except OSError:
+            return None
+        try:
+            # Mark as recently used
+            os.utime(entryPath)
+        except OSError:
+            pass
+        return data
+
+    def writeEntry(self, entryPath: Path, data):
+        try:
+            entryPath.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file first so other processes never see a partial entry
+            tempPath = entryPath.with_name(f"{entryPath.name}.{os.getpid()}.tmp")
+            tempPath.write_bytes(data)
+            os.replace(tempPath, entryPath)
+        except OSError:
+            # The cache is only an optimization, failing to write it is not fatal
+            pass
+
+    def getEntries(self) -> list[tuple[float, int, Path]]:
+        entries = []
+        if not self.directory.exists():
+            return entries
+        for dirpath, _, filenames in os.walk(self.directory):
+            for filename in filenames:
+                entryPath = Path(dirpath, filename)
+                try:
+                    stat = entryPath.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entryPath))
+        return entries
+
+    def trim(self) -> tuple[int, int]:
+        """Evicts the least recently used entries until the cache fits in `maxSize`.
+
+        Returns the amount of evicted entries and the amount of freed bytes.
+        """
+        entries = self.getEntries()
+        totalSize = sum(size for _, size, _ in entries)
+
+        evicted = 0
+        freed = 0
+        entries.sort()
+        for _, size, entryPath in entries:
+            if totalSize - freed <= self.maxSize:
+                break
+            try:
+                entryPath.unlink()
+            except OSError:
+                continue
+            evicted += 1
+            freed += size
+        return evicted, freed
+
+
+def cacheMain(description: str, makeCache: Callable[[Path, int], DiskLruCache], defaultDirectory: Path, defaultMaxSize: int):
+    """Command line shared by every cache: shows the size of the cache, or trims it."""
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("--cache-dir", help=f"Cache directory. Defaults to '{defaultDirectory}'.", type=Path, default=defaultDirectory)
+    parser.add_argument("--max-size", help=f"Maximum size of the cache in MiB. Defaults to {defaultMaxSize // (1024 * 1024)}.", type=int, default=defaultMaxSize // (1024 * 1024))
+    parser.add_argument("--trim", help="Evict the least recently used entries until the cache fits in --max-size.", action="store_true")
+    args = parser.parse_args()
+
+    cache = makeCache(args.cache_dir, args.max_size * 1024 * 1024)
+
+    if args.trim:
+        evicted, freed = cache.trim()
+        print(f"Evicted {evicted} entries ({freed / (1024 * 1024):.2f} MiB).")
+
+    entries = cache.getEntries()
+    totalSize = sum(size for _, size, _ in entries)
+    print(f"{len(entries)} entries, {totalSize / (1024 * 1024):.2f} MiB in '{cache.directory}'.")
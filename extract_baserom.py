@@ -3,15 +3,23 @@
 from __future__ import annotations
 
 import argparse
+import mmap
 import os
 import sys
-import struct
-from multiprocessing import Pool, cpu_count, Manager
-import zlib
-import libyaz0
+import time
+from multiprocessing import Manager, Pool, cpu_count
+
+from compression import detectCodecOrFail
+from data_hash import hash_data
+from decompression_cache import DecompressionCache, decompressMaybeCached
+from tools.mips.DmaTable import DmaTable
+from tools.mips.BaseromPack import BaseromPackEntry, getBaseromPackPath, layoutBaseromPack, packBaseromIndex
 
 
 ROM_FILE_NAME_V = '{}_{}.z64'
+MANIFEST_FILE_NAME = 'baserom_manifest.csv'
+OBJECT_STORE_DIR = '.objects'
+OBJECT_FILE_MODE = 0o444
 FILE_TABLE_OFFSET = {
     "OOT": {
         "NER":        0x07430, # a.k.a. NN0 RC
@@ -109,11 +117,24 @@ FILE_NAMES["OOT"]["NJ1"]  = FILE_NAMES["OOT"]["NE1"]
 FILE_NAMES["OOT"]["NJ2"]  = FILE_NAMES["OOT"]["NE2"]
 FILE_NAMES["OOT"]["PAL WII 1.1"] = FILE_NAMES["OOT"]["NP1"]
 
-romData: bytes = None
+# name, vrom start, vrom end, rom start, rom end, output size, hash of the rom data, hash of the output
+ManifestEntry = tuple[str, int, int, int, int, int, str, str]
+
+romData: mmap.mmap = None
+romDmaTable: DmaTable = None
 Edition = "" # "cpm"
 Version = "" # "CPM"
 OnlyDma = False
 OnlyBuild = False
+UseStore = False
+UsePack = False
+Quiet = False
+PackLayout: dict[str, BaseromPackEntry] | None = None
+packFd = -1
+decompressionCache: DecompressionCache | None = None
+workerStartupTime = 0.0
+previousManifest: dict[str, ManifestEntry] = dict()
+benchManagerDmaTable = None
 
 
 def readFile(filepath):
@@ -173,71 +194,146 @@ def readFilelists():
     FILE_NAMES["DNM"]["JP"] = readFile("dnm/filelists/filelist_dnm_jp.txt")
     FILE_NAMES["DNM"]["CN"] = FILE_NAMES["DNM"]["JP"] # for now
 
-def initialize_worker(rom_data: bytes, dmaTable: dict):
-    global romData
-    global globalDmaTable
-    romData = rom_data
-    globalDmaTable = dmaTable
+def map_rom_file(filename) -> mmap.mmap:
+    # Every worker maps the rom on its own, so the pages are shared with the
+    # page cache instead of pickling a copy of the whole rom into each process
+    with open(filename, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
-def read_uint32_be(offset):
-    return struct.unpack('>I', romData[offset:offset+4])[0]
+def initialize_worker(romPath, cache: DecompressionCache | None, manifest: dict[str, ManifestEntry], poolStartTime: float = 0.0, packPath=None):
+    global romData
+    global romDmaTable
+    global decompressionCache
+    global previousManifest
+    global workerStartupTime
+    global packFd
+    romData = map_rom_file(romPath)
+    romDmaTable = read_dma_table(romData)
+    decompressionCache = cache
+    previousManifest = manifest
+    if packPath is not None:
+        packFd = os.open(packPath, os.O_WRONLY)
+    if poolStartTime != 0.0:
+        workerStartupTime = time.time() - poolStartTime
+
+def get_worker_memory() -> tuple[int, int]:
+    """Returns the resident set size and its anonymous (private) part of the current process, in bytes."""
+    try:
+        status = dict()
+        with open("/proc/self/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                status[key] = value.strip()
+        return int(status["VmRSS"].split()[0]) * 1024, int(status["RssAnon"].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        # Not Linux, fallback to the peak rss
+        import resource
+        maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != "darwin":
+            maxRss *= 1024
+        return maxRss, 0
+
+def read_dma_table(rom_data) -> DmaTable:
+    return DmaTable.fromRom(rom_data, FILE_TABLE_OFFSET[Game][Version], len(FILE_NAMES[Game][Version]))
+
+def get_temp_output_name(name):
+    return f"{name}.{os.getpid()}.tmp"
+
+# Both writers go through a temporary file which is renamed at the end, so
+# an interrupted run never leaves a partially written file in `baserom/`.
 
 def write_empty_output_file(name, size):
+    tempName = get_temp_output_name(name)
     try:
-        with open(name, 'wb+') as f:
+        with open(tempName, 'wb+') as f:
             # Write a 0 to pad to the right size
             f.seek(size-1)
             f.write(bytearray([0]))
+        os.replace(tempName, name)
     except IOError:
         print('failed to write file ' + name)
         sys.exit(1)
 
-def write_output_file(name, offset, size):
+def write_output_file(name, data, mode: int | None = None):
+    tempName = get_temp_output_name(name)
     try:
-        with open(name, 'wb') as f:
-            f.write(romData[offset:offset+size])
+        with open(tempName, 'wb') as f:
+            f.write(data)
+        if mode is not None:
+            os.chmod(tempName, mode)
+        os.replace(tempName, name)
     except IOError:
         print('failed to write file ' + name)
         sys.exit(1)
 
 
-def decompressZlib(data: bytearray) -> bytearray:
-    decomp = zlib.decompressobj(-zlib.MAX_WBITS)
-    output = bytearray()
-    output.extend(decomp.decompress(data))
-    while decomp.unconsumed_tail:
-        output.extend(decomp.decompress(decomp.unconsumed_tail))
-    output.extend(decomp.flush())
-    return output
+def get_object_path(dataHash: str):
+    return os.path.join(Basedir, OBJECT_STORE_DIR, dataHash[:2], dataHash)
+
+def write_output_file_to_store(name, data, dataHash: str):
+    """Writes the data once into the object store, and hardlinks `name` to it.
 
-def writeBytearrayToFile(filepath: str, array_of_bytes: bytearray):
-    with open(filepath, mode="wb") as f:
-       f.write(array_of_bytes)
+    Objects are read-only, since editing any of their links edits the object itself. An object which doesn't match its
+    hash anyway is written again instead of being linked to.
+    """
+    objectPath = get_object_path(dataHash)
+    if not output_file_matches(objectPath, len(data), dataHash):
+        os.makedirs(os.path.dirname(objectPath), exist_ok=True)
+        write_output_file(objectPath, data, OBJECT_FILE_MODE)
+
+    tempName = get_temp_output_name(name)
+    try:
+        os.link(objectPath, tempName)
+        os.replace(tempName, name)
+    except OSError:
+        # Hardlinks are not supported here, fallback to a regular copy
+        write_output_file(name, data)
+
+def is_linked_to_object(name, dataHash: str) -> bool:
+    """Whether `name` is a hardlink to its object. False if the object is not in the store (yet), e.g. the first time `--store` is used."""
+    try:
+        return os.path.samefile(name, get_object_path(dataHash))
+    except OSError:
+        return False
+
+def write_pack_payload(name, data):
+    # Every file already has its place in the pack, so the workers can write them in any order
+    entry = PackLayout[name]
+    if len(data) != entry.size:
+        print(f"Unexpected size for {name}: 0x{len(data):X} instead of 0x{entry.size:X}")
+        sys.exit(1)
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        written += os.pwrite(packFd, view[written:], entry.offset + written)
 
-def readFileAsBytearray(filepath: str) -> bytearray:
-    if not os.path.exists(filepath):
-        return bytearray(0)
-    with open(filepath, mode="rb") as f:
-        return bytearray(f.read())
+def output_file_matches(name, size: int, dataHash: str) -> bool:
+    try:
+        if os.path.getsize(name) != size:
+            return False
+        with open(name, 'rb') as f:
+            return hash_data(f.read()) == dataHash
+    except OSError:
+        return False
 
+def ExtractFunc(i) -> ManifestEntry | None:
+    """Extracts the `i`th file of the rom and returns its manifest entry, or None if it was skipped.
 
-def ExtractFunc(i):
+    Files whose rom data and output are the same as in the previous manifest are not extracted again.
+    """
     versionName = FILE_NAMES[Game][Version][i]
     if versionName == "":
-        print(f"Skipping {i} because it doesn't have a name.")
-        return
+        if not Quiet:
+            print(f"Skipping {i} because it doesn't have a name.")
+        return None
     filename = os.path.join(Basedir, Edition, "baserom", versionName)
-    entryOffset = FILE_TABLE_OFFSET[Game][Version] + 16 * i
 
-    virtStart = read_uint32_be(entryOffset + 0)
-    virtEnd   = read_uint32_be(entryOffset + 4)
-    physStart = read_uint32_be(entryOffset + 8)
-    physEnd   = read_uint32_be(entryOffset + 12)
+    virtStart, virtEnd, physStart, physEnd = romDmaTable[i]
 
     deleted = False
     if physStart == 0xFFFFFFFF and physEnd == 0xFFFFFFFF: # file deleted
         if (virtEnd - virtStart) == 0:
-            return
+            return None
         # physStart = virtStart
         # physEnd = 0
         compressed = False
@@ -251,31 +347,57 @@ def ExtractFunc(i):
         compressed = True
         size = physEnd - physStart
 
-    globalDmaTable[versionName].append(virtStart)
-    globalDmaTable[versionName].append(virtEnd)
-    globalDmaTable[versionName].append(physStart)
-    globalDmaTable[versionName].append(physEnd)
-
     if OnlyDma:
-        return
+        return (versionName, virtStart, virtEnd, physStart, physEnd, 0, "", "")
 
-    print('Extracting ' + filename + " (0x%08X, 0x%08X)" % (virtStart, virtEnd))
+    if deleted:
+        sourceHash = ""
+    else:
+        # Slicing the memoryview doesn't copy the data out of the rom
+        source = memoryview(romData)[physStart:physStart+size]
+        sourceHash = hash_data(source)
+
+    previous = previousManifest.get(versionName)
+    if previous is not None and previous[:5] == (versionName, virtStart, virtEnd, physStart, physEnd) and previous[6] == sourceHash:
+        if output_file_matches(filename, previous[5], previous[7]):
+            if not UseStore or is_linked_to_object(filename, previous[7]):
+                return previous
+
+    if not Quiet:
+        print('Extracting ' + filename + " (0x%08X, 0x%08X)" % (virtStart, virtEnd))
 
     if deleted:
+        data = bytes(size)
+    else:
+        data = source
+        if compressed:
+            # print(f"decompressing {filename}")
+            codec = detectCodecOrFail(data)
+            data = decompressMaybeCached(decompressionCache, codec.name, data, codec.decompress)
+    dataHash = hash_data(data)
+
+    if PackLayout is not None:
+        # The pack starts zeroed, so deleted files don't need to be written
+        if not deleted:
+            write_pack_payload(versionName, data)
+    elif UseStore:
+        write_output_file_to_store(filename, data, dataHash)
+    elif deleted:
         write_empty_output_file(filename, size)
     else:
-        write_output_file(filename, physStart, size)
-
-    if compressed:
-        # print(f"decompressing {filename}")
-        if Edition in ("iqt", "iqs", "cn"):
-            data = readFileAsBytearray(filename)
-            decompressed = decompressZlib(data)
-            writeBytearrayToFile(filename, decompressed)
-        else:
-            data = readFileAsBytearray(filename)
-            decompressed = libyaz0.decompress(data)
-            writeBytearrayToFile(filename, decompressed)
+        write_output_file(filename, data)
+
+    return (versionName, virtStart, virtEnd, physStart, physEnd, len(data), sourceHash, dataHash)
+
+def countSkippedFiles(fileNames: list[str]) -> int:
+    """Returns how many files `ExtractFunc` skips because they don't have a name."""
+    return sum(1 for name in fileNames if name == "")
+
+def ExtractFuncWithStats(i) -> tuple[ManifestEntry | None, int, float, int, int]:
+    """Same as `ExtractFunc`, but also returns the pid, startup time and memory usage of the worker."""
+    entry = ExtractFunc(i)
+    rss, rssAnon = get_worker_memory()
+    return entry, os.getpid(), workerStartupTime, rss, rssAnon
 
 #####################################################################
 
@@ -308,6 +430,57 @@ def printBuildData(rom_data: bytes):
     #print(f"| Make Option:  {buildMakeOption}".ljust(39) + "|")
     print("========================================")
 
+def addDmaEntry(dmaTable: dict[str, list[int]], entry: ManifestEntry | None):
+    if entry is None:
+        return
+    name, *addresses = entry[:5]
+    dmaTable[name].extend(addresses)
+
+def getManifestPath():
+    return os.path.join(Basedir, Edition, "tables", MANIFEST_FILE_NAME)
+
+def readManifest() -> dict[str, ManifestEntry]:
+    manifest: dict[str, ManifestEntry] = dict()
+    try:
+        with open(getManifestPath()) as f:
+            for line in f:
+                row = line.strip().split(",")
+                if len(row) != 8:
+                    continue
+                name, vStart, vEnd, pStart, pEnd, size, sourceHash, dataHash = row
+                manifest[name] = (name, int(vStart, 16), int(vEnd, 16), int(pStart, 16), int(pEnd, 16), int(size, 16), sourceHash, dataHash)
+    except (OSError, ValueError):
+        return dict()
+    return manifest
+
+def writeManifest(entries: list[ManifestEntry]):
+    manifestPath = getManifestPath()
+    tempPath = get_temp_output_name(manifestPath)
+    with open(tempPath, "w") as f:
+        for name, vStart, vEnd, pStart, pEnd, size, sourceHash, dataHash in entries:
+            f.write(f"{name},{vStart:X},{vEnd:X},{pStart:X},{pEnd:X},{size:X},{sourceHash},{dataHash}\n")
+    os.replace(tempPath, manifestPath)
+
+def verifyManifest() -> bool:
+    """Checks the extracted files against the manifest, without reading the rom."""
+    manifest = readManifest()
+    if len(manifest) == 0:
+        print(f"Missing or empty manifest '{getManifestPath()}'.")
+        return False
+
+    badFiles = 0
+    for name, _, _, _, _, size, _, dataHash in manifest.values():
+        filename = os.path.join(Basedir, Edition, "baserom", name)
+        if not os.path.exists(filename):
+            print(f"Missing: {filename}")
+            badFiles += 1
+        elif not output_file_matches(filename, size, dataHash):
+            print(f"Changed: {filename}")
+            badFiles += 1
+
+    print(f"{len(manifest) - badFiles}/{len(manifest)} files match the manifest.")
+    return badFiles == 0
+
 def writeDma(dmaTable):
     filetable = os.path.join(Basedir, Edition, "tables", "dma_addresses.csv")
     print(f"Creating {filetable}")
@@ -318,7 +491,71 @@ def writeDma(dmaTable):
                 print(line)
             f.write(line + "\n")
 
-def extract_rom(j):
+def printStoreStats():
+    objectCount = 0
+    storeSize = 0
+    linkedSize = 0
+    for dirpath, _, filenames in os.walk(os.path.join(Basedir, OBJECT_STORE_DIR)):
+        for objectName in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, objectName))
+            except OSError:
+                continue
+            objectCount += 1
+            storeSize += stat.st_size
+            # Every link besides the object itself is an extracted file
+            linkedSize += stat.st_size * max(stat.st_nlink - 1, 0)
+
+    saved = linkedSize - storeSize
+    print("========================================")
+    print(f"Object store: {objectCount} objects, {storeSize/(1024*1024):.2f} MiB")
+    print(f"Extracted files: {linkedSize/(1024*1024):.2f} MiB")
+    if linkedSize > 0:
+        print(f"Deduplicated: {saved/(1024*1024):.2f} MiB ({100*saved/linkedSize:.1f}%)")
+    print("========================================")
+
+def printWorkerStats(workerStats: dict[int, tuple[float, int, int]], elapsed: float):
+    print("========================================")
+    print(f"Extracted in {elapsed:.2f}s with {len(workerStats)} process(es)")
+    print(f"{'pid':>8} {'startup':>10} {'rss':>10} {'private':>10}")
+    for pid, (startup, rss, rssAnon) in sorted(workerStats.items()):
+        print(f"{pid:>8} {startup*1000:>8.1f}ms {rss/(1024*1024):>7.1f}MiB {rssAnon/(1024*1024):>7.1f}MiB")
+    print("========================================")
+
+def addWorkerStats(workerStats: dict[int, tuple[float, int, int]], pid: int, startup: float, rss: int, rssAnon: int):
+    _, prevRss, prevRssAnon = workerStats.get(pid, (0.0, 0, 0))
+    workerStats[pid] = (startup, max(rss, prevRss), max(rssAnon, prevRssAnon))
+
+def create_pack(rom_data, file_names_table: list[str]) -> tuple[list[BaseromPackEntry], str]:
+    """Lays out every file in a new temporary pack, and returns its entries and path."""
+    global PackLayout
+
+    dmaTable = read_dma_table(rom_data)
+    packFiles: dict[str, int] = dict()
+    for name, size, deleted in zip(file_names_table, dmaTable.sizes.tolist(), dmaTable.deletedMask.tolist()):
+        if name == "" or (deleted and size == 0):
+            continue
+        packFiles[name] = size
+
+    packEntries, packSize = layoutBaseromPack(list(packFiles.items()))
+    PackLayout = {entry.name: entry for entry in packEntries}
+
+    tempPackPath = get_temp_output_name(str(getBaseromPackPath(Basedir, Edition)))
+    with open(tempPackPath, "wb") as f:
+        f.write(packBaseromIndex(packEntries))
+        f.truncate(packSize)
+    return packEntries, tempPackPath
+
+def finish_pack(packEntries: list[BaseromPackEntry], tempPackPath: str, manifestEntries: dict[str, ManifestEntry]):
+    for entry in packEntries:
+        entry.dataHash = bytes.fromhex(manifestEntries[entry.name][7])
+    with open(tempPackPath, "r+b") as f:
+        f.write(packBaseromIndex(packEntries))
+    packPath = getBaseromPackPath(Basedir, Edition)
+    os.replace(tempPackPath, packPath)
+    print(f"Wrote {len(packEntries)} files to {packPath}")
+
+def extract_rom(j, useCache: bool, showStats: bool = False):
     print("Reading filelists...")
     readFilelists()
 
@@ -327,15 +564,17 @@ def extract_rom(j):
         print(f"'{Edition}' is not supported yet because the filelist is missing.")
         sys.exit(2)
 
-    os.makedirs(os.path.join(Basedir, Edition, "baserom"), exist_ok=True)
+    if UsePack:
+        os.makedirs(os.path.join(Basedir, Edition), exist_ok=True)
+    else:
+        os.makedirs(os.path.join(Basedir, Edition, "baserom"), exist_ok=True)
 
     filename = os.path.join(Basedir, ROM_FILE_NAME_V.format(Basedir, Edition))
 
     # read baserom data
     try:
-        with open(filename, 'rb') as f:
-            rom_data = f.read()
-    except IOError:
+        rom_data = map_rom_file(filename)
+    except (IOError, ValueError):
         print('Failed to read file ' + filename)
         sys.exit(1)
 
@@ -343,26 +582,52 @@ def extract_rom(j):
         printBuildData(rom_data)
         sys.exit(0)
 
-    if j:
-        manager = Manager()
-        dmaTable = manager.dict()
-        for name in file_names_table:
-            dmaTable[name] = manager.list()
-    else:
-        dmaTable = dict()
-        for name in file_names_table:
-            dmaTable[name] = list()
+    # Filled in filelist order, so the csv doesn't depend on the order the workers finish
+    dmaTable: dict[str, list[int]] = dict()
+    for name in file_names_table:
+        dmaTable[name] = list()
+    manifestEntries: dict[str, ManifestEntry] = dict()
+
+    # The manifest describes the files in baserom/, which a pack doesn't touch
+    manifest = readManifest() if not OnlyDma and not UsePack else dict()
+
+    packEntries: list[BaseromPackEntry] = []
+    tempPackPath = None
+    if UsePack and not OnlyDma:
+        packEntries, tempPackPath = create_pack(rom_data, file_names_table)
+
+    cache = DecompressionCache() if useCache else None
+
+    workerStats: dict[int, tuple[float, int, int]] = dict()
+    extractFunc = ExtractFuncWithStats if showStats else ExtractFunc
 
     # extract files
+    startTime = time.time()
     if j:
         num_cores = cpu_count()
         print("Extracting rom with " + str(num_cores) + " CPU cores.")
-        with Pool(num_cores, initialize_worker, (rom_data, dmaTable)) as p:
-            p.map(ExtractFunc, range(len(file_names_table)))
+        with Pool(num_cores, initialize_worker, (filename, cache, manifest, startTime, tempPackPath)) as p:
+            for result in p.imap_unordered(extractFunc, range(len(file_names_table)), chunksize=16):
+                if showStats:
+                    result, *stats = result
+                    addWorkerStats(workerStats, *stats)
+                addDmaEntry(dmaTable, result)
+                if result is not None:
+                    manifestEntries[result[0]] = result
     else:
-        initialize_worker(rom_data, dmaTable)
+        initialize_worker(filename, cache, manifest, startTime, tempPackPath)
         for i in range(len(file_names_table)):
-            ExtractFunc(i)
+            result = extractFunc(i)
+            if showStats:
+                result, *stats = result
+                addWorkerStats(workerStats, *stats)
+            addDmaEntry(dmaTable, result)
+            if result is not None:
+                manifestEntries[result[0]] = result
+    elapsed = time.time() - startTime
+
+    if cache is not None:
+        cache.trim()
 
     if not OnlyDma:
         printBuildData(rom_data)
@@ -371,6 +636,98 @@ def extract_rom(j):
 
     writeDma(dmaTable)
 
+    if tempPackPath is not None:
+        finish_pack(packEntries, tempPackPath, manifestEntries)
+    elif not OnlyDma:
+        entries = [manifestEntries[name] for name in dmaTable if name in manifestEntries]
+        writeManifest(entries)
+
+    if UseStore and not OnlyDma:
+        printStoreStats()
+
+    if showStats:
+        printWorkerStats(workerStats, elapsed)
+
+def initialize_manager_worker(romPath, dmaTable):
+    global benchManagerDmaTable
+    initialize_worker(romPath, None, dict())
+    benchManagerDmaTable = dmaTable
+
+def ExtractFuncToManager(i):
+    """How `-j` used to collect the dma table, only kept for `--bench`: every address is appended to a `Manager` proxied list."""
+    entry = ExtractFunc(i)
+    if entry is None:
+        return
+    name, virtStart, virtEnd, physStart, physEnd = entry[:5]
+    benchManagerDmaTable[name].append(virtStart)
+    benchManagerDmaTable[name].append(virtEnd)
+    benchManagerDmaTable[name].append(physStart)
+    benchManagerDmaTable[name].append(physEnd)
+
+def bench_dma_table(iterations: int):
+    """Times collecting the dma table with `-j` through `Manager` proxies, like it used to, and through the values returned by `ExtractFunc`.
+
+    Both include starting the pool (and the manager), like a real extraction does. Nothing is written.
+    """
+    global OnlyDma
+
+    readFilelists()
+    file_names_table = FILE_NAMES[Game][Version]
+    if file_names_table is None:
+        print(f"'{Edition}' is not supported yet because the filelist is missing.")
+        sys.exit(2)
+
+    filename = os.path.join(Basedir, ROM_FILE_NAME_V.format(Basedir, Edition))
+    if not os.path.exists(filename):
+        print('Failed to read file ' + filename)
+        sys.exit(1)
+
+    # Set before the pools are created so the workers inherit it
+    OnlyDma = True
+
+    indices = range(len(file_names_table))
+    num_cores = cpu_count()
+
+    startTime = time.time()
+    for _ in range(iterations):
+        with Manager() as manager:
+            proxiedTable = manager.dict()
+            for name in file_names_table:
+                proxiedTable[name] = manager.list()
+            with Pool(num_cores, initialize_manager_worker, (filename, proxiedTable)) as p:
+                p.map(ExtractFuncToManager, indices)
+            managerTable = {name: list(proxiedTable[name]) for name in file_names_table}
+    managerTime = (time.time() - startTime) / iterations
+
+    startTime = time.time()
+    for _ in range(iterations):
+        returnTable: dict[str, list[int]] = dict()
+        for name in file_names_table:
+            returnTable[name] = list()
+        with Pool(num_cores, initialize_worker, (filename, None, dict())) as p:
+            for result in p.imap_unordered(ExtractFunc, indices, chunksize=16):
+                addDmaEntry(returnTable, result)
+    returnTime = (time.time() - startTime) / iterations
+
+    if managerTable != returnTable:
+        print("The dma tables collected through the manager and through the return values don't match!")
+        sys.exit(1)
+
+    print(f"{len(file_names_table)} files with {num_cores} CPU cores, average of {iterations} runs:")
+    print(f"  Manager proxies: {managerTime * 1000:8.2f} ms")
+    print(f"  Return values:   {returnTime * 1000:8.2f} ms ({managerTime / returnTime:.1f}x faster)")
+
+def set_version(game: str, edition: str):
+    global Basedir
+    global Game
+    global Edition
+    global Version
+
+    Basedir   = game
+    Game      = game.upper()
+    Edition   = edition
+    Version   = Edition.upper().replace("_", " ")
+
 def main():
     description = "Extracts files from the rom. Will try to read the rom 'version.z64', or 'baserom.z64' if that doesn't exist."
 
@@ -394,27 +751,42 @@ For details on what these abbreviations mean, see the README.md.
     parser.add_argument("-j", help="Enables multiprocessing.", action="store_true")
     parser.add_argument("--dma", help="Extract only the dma addresses", action="store_true")
     parser.add_argument("--build", help="Only print the build data", action="store_true")
+    parser.add_argument("--no-cache", help="Don't use the shared decompression cache.", action="store_true")
+    parser.add_argument("--store", help=f"Write every file once into '{{game}}/{OBJECT_STORE_DIR}/' and hardlink it into baserom/, so files that are identical across versions are only stored once.", action="store_true")
+    parser.add_argument("--pack", help="Write every file into a single '{game}/{version}/baserom.pack' instead of the baserom/ folder.", action="store_true")
+    parser.add_argument("--verify", help=f"Only check the extracted files against '{MANIFEST_FILE_NAME}', without reading the rom.", action="store_true")
+    parser.add_argument("--stats", help="Print the startup time and memory usage of every worker process at the end.", action="store_true")
+    parser.add_argument("--bench", help="Only time collecting the dma table with -j, through Manager proxies like it used to and through the values returned by the workers, averaged over N runs (5 by default). Nothing is written.", type=int, nargs="?", const=5, metavar="N")
     args = parser.parse_args()
 
-    global Basedir
-    global Game
-    global Edition
-    global Version
     global OnlyDma
     global OnlyBuild
+    global UseStore
+    global UsePack
 
-    Basedir   = args.game
-    Game      = args.game.upper()
-    Edition   = args.edition
-    Version   = Edition.upper().replace("_", " ")
+    set_version(args.game, args.edition)
     OnlyDma   = args.dma
     OnlyBuild = args.build
+    UseStore  = args.store
+    UsePack   = args.pack
+
+    if UseStore and UsePack:
+        parser.error("--store and --pack can't be used together")
 
     if Edition not in edition_choices[args.game]:
         print(f"The selected edition '{Edition}' is not a valid option for the game '{args.game}'")
         exit(1)
 
-    extract_rom(args.j)
+    if args.verify:
+        if not verifyManifest():
+            sys.exit(1)
+        return
+
+    if args.bench is not None:
+        bench_dma_table(max(args.bench, 1))
+        return
+
+    extract_rom(args.j, not args.no_cache, args.stats)
 
 if __name__ == "__main__":
     main()
@@ -2,7 +2,8 @@
 
 import argparse
 from pathlib import Path
-import struct
+
+from tools.mips.DmaTable import DmaTable
 
 def readFile(filepath):
     with open(filepath) as f:
@@ -14,28 +15,13 @@ def readFileAsBytearray(filepath: Path) -> bytearray:
     with filepath.open(mode="rb") as f:
         return bytearray(f.read())
 
-def read_uint32_be(offset):
-    return struct.unpack('>I', romData[offset:offset+4])[0]
-
 def extract_dma(address):
-    offset = address
-
-    while True:
-        fileName = nameData[(offset - address) // 0x10] if len(nameData) > 0 else ""
-
-        fileVROMStart = read_uint32_be(offset)
-        offset += 4
-        fileVROMEnd = read_uint32_be(offset)
-        offset += 4
-        fileROMStart = read_uint32_be(offset)
-        offset += 4
-        fileROMEnd = read_uint32_be(offset)
-        offset += 4
-
-        if fileROMEnd != 0:
-            compressed = True
-        else:
-            compressed = False
+    dmaTable = DmaTable.fromRom(romData, address)
+
+    for i, (fileVROMStart, fileVROMEnd, fileROMStart, fileROMEnd) in enumerate(dmaTable):
+        fileName = nameData[i] if len(nameData) > 0 else ""
+
+        compressed = fileROMEnd != 0
 
         if fileName != "":
             print(f"{fileName},", end="")
@@ -45,9 +31,6 @@ def extract_dma(address):
         print(f"{fileVROMStart:08X},{fileVROMEnd:08X},{fileROMStart:08X},{fileROMEnd:08X},{fileVROMEnd - fileVROMStart:6X},", end="")
         print(compressed)
 
-        if read_uint32_be(offset) == 0:
-            break
-
 def main():
     description = "Extracts dmadata from a rom given the starting address."
     epilog = ""
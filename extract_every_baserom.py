@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import mmap
+from multiprocessing import Pool, cpu_count
+import os
+import sys
+import time
+
+import extract_baserom
+from extract_baserom import FILE_TABLE_OFFSET, FILE_NAMES, ROM_FILE_NAME_V, ManifestEntry, readFilelists, set_version, map_rom_file, read_dma_table, readManifest, writeManifest, writeDma, addDmaEntry, countSkippedFiles
+from decompression_cache import DecompressionCache
+from tools.mips.DmaTable import DmaTable
+
+
+GAMES = ["oot", "mm", "dnm"]
+
+# (game, edition, index in the filelist, decompressed size)
+ExtractionTask = tuple[str, str, int, int]
+
+# Per worker, every rom, dmadata and manifest is only read when a task of its version shows up
+workerRoms: dict[tuple[str, str], mmap.mmap] = dict()
+workerDmaTables: dict[tuple[str, str], DmaTable] = dict()
+workerManifests: dict[tuple[str, str], dict[str, ManifestEntry]] = dict()
+
+
+def getEditions(game: str) -> list[str]:
+    return [version.lower().replace(" ", "_") for version in FILE_TABLE_OFFSET[game.upper()]]
+
+def getRomPath(game: str, edition: str) -> str:
+    return os.path.join(game, ROM_FILE_NAME_V.format(game, edition))
+
+def findVersionsToExtract(games: list[str]) -> list[tuple[str, str]]:
+    versions = []
+    for game in games:
+        for edition in getEditions(game):
+            if FILE_NAMES[game.upper()][edition.upper().replace("_", " ")] is None:
+                continue
+            if not os.path.exists(getRomPath(game, edition)):
+                continue
+            versions.append((game, edition))
+    return versions
+
+def getVersionTasks(game: str, edition: str) -> tuple[list[ExtractionTask], int]:
+    """Returns the extraction tasks of a version, and how many of its files the workers will skip."""
+    set_version(game, edition)
+    romData = map_rom_file(getRomPath(game, edition))
+    dmaTable = read_dma_table(romData)
+    romData.close()
+
+    fileNames = FILE_NAMES[game.upper()][edition.upper().replace("_", " ")]
+    sizes = dmaTable.sizes.tolist()
+    return [(game, edition, i, size) for i, size in enumerate(sizes)], countSkippedFiles(fileNames)
+
+
+def initialize_worker(cache: DecompressionCache | None, useStore: bool):
+    extract_baserom.decompressionCache = cache
+    extract_baserom.UseStore = useStore
+    extract_baserom.Quiet = True
+
+def extractVersionFile(task: ExtractionTask) -> tuple[str, str, int, ManifestEntry | None]:
+    game, edition, i, size = task
+    set_version(game, edition)
+
+    key = (game, edition)
+    if key not in workerRoms:
+        workerRoms[key] = map_rom_file(getRomPath(game, edition))
+        workerDmaTables[key] = read_dma_table(workerRoms[key])
+        workerManifests[key] = readManifest()
+    extract_baserom.romData = workerRoms[key]
+    extract_baserom.romDmaTable = workerDmaTables[key]
+    extract_baserom.previousManifest = workerManifests[key]
+
+    return game, edition, size, extract_baserom.ExtractFunc(i)
+
+
+def printProgress(doneFiles: int, totalFiles: int, doneBytes: int, totalBytes: int, elapsed: float, end: str = ""):
+    eta = ""
+    if doneBytes > 0 and doneBytes < totalBytes:
+        eta = f", ETA {elapsed * (totalBytes - doneBytes) / doneBytes:.0f}s"
+    percentage = 100 * doneBytes / totalBytes if totalBytes > 0 else 100
+    print(f"\r[{doneFiles}/{totalFiles}] {percentage:5.1f}% {doneBytes/(1024*1024):.1f}/{totalBytes/(1024*1024):.1f} MiB, {elapsed:.0f}s elapsed{eta}".ljust(79), end=end, flush=True)
+
+def extractEveryBaserom(games: list[str], numCores: int, useCache: bool, useStore: bool):
+    readFilelists()
+
+    versions = findVersionsToExtract(games)
+    if len(versions) == 0:
+        print("No ROMs found.")
+        return
+
+    tasks: list[ExtractionTask] = []
+    skippedFiles: dict[tuple[str, str], int] = dict()
+    dmaTables: dict[tuple[str, str], dict[str, list[int]]] = dict()
+    manifestEntries: dict[tuple[str, str], dict[str, ManifestEntry]] = dict()
+    for game, edition in versions:
+        print(f"Found {getRomPath(game, edition)}")
+        os.makedirs(os.path.join(game, edition, "baserom"), exist_ok=True)
+        versionTasks, skippedFiles[(game, edition)] = getVersionTasks(game, edition)
+        tasks.extend(versionTasks)
+        # Filled in filelist order, so the csv doesn't depend on the order the workers finish
+        dmaTables[(game, edition)] = {name: list() for name in FILE_NAMES[game.upper()][edition.upper().replace("_", " ")]}
+        manifestEntries[(game, edition)] = dict()
+
+    # Biggest files first, so the slow ones don't end up last
+    tasks.sort(key=lambda task: task[3], reverse=True)
+
+    cache = DecompressionCache() if useCache else None
+
+    totalBytes = sum(task[3] for task in tasks)
+    doneBytes = 0
+    doneFiles = 0
+    lastPrint = 0.0
+    print(f"Extracting {len(tasks)} files from {len(versions)} ROMs with {numCores} processes.")
+    startTime = time.perf_counter()
+    with Pool(numCores, initialize_worker, (cache, useStore)) as p:
+        for game, edition, size, entry in p.imap_unordered(extractVersionFile, tasks, chunksize=4):
+            addDmaEntry(dmaTables[(game, edition)], entry)
+            if entry is not None:
+                manifestEntries[(game, edition)][entry[0]] = entry
+            doneBytes += size
+            doneFiles += 1
+
+            now = time.perf_counter()
+            if now - lastPrint > 0.5:
+                printProgress(doneFiles, len(tasks), doneBytes, totalBytes, now - startTime)
+                lastPrint = now
+    printProgress(doneFiles, len(tasks), doneBytes, totalBytes, time.perf_counter() - startTime, end="\n")
+
+    # The workers don't print the files they skip, so they don't break the progress line
+    for (game, edition), skipped in skippedFiles.items():
+        if skipped > 0:
+            print(f"{getRomPath(game, edition)}: skipped {skipped} files without a name.")
+
+    if cache is not None:
+        cache.trim()
+
+    extract_baserom.UseStore = useStore
+    for game, edition in versions:
+        set_version(game, edition)
+        os.makedirs(os.path.join(game, edition, "tables"), exist_ok=True)
+        dmaTable = dmaTables[(game, edition)]
+        writeDma(dmaTable)
+        entries = manifestEntries[(game, edition)]
+        writeManifest([entries[name] for name in dmaTable if name in entries])
+
+    if useStore:
+        for game in sorted({game for game, _ in versions}):
+            set_version(game, "")
+            extract_baserom.printStoreStats()
+
+
+def main():
+    description = "Extracts every version of a game (or of every game) with a single pool of processes. Versions whose ROM is missing are skipped."
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("game", help="Game to extract, or 'all'.", choices=GAMES + ["all"])
+    parser.add_argument("-j", help="Number of processes. Defaults to every CPU core.", type=int, default=cpu_count())
+    parser.add_argument("--no-cache", help="Don't use the shared decompression cache.", action="store_true")
+    parser.add_argument("--store", help="Write every file once into '{game}/.objects/' and hardlink it into baserom/, like `extract_baserom.py --store`.", action="store_true")
+    args = parser.parse_args()
+
+    games = GAMES if args.game == "all" else [args.game]
+    extractEveryBaserom(games, max(1, args.j), not args.no_cache, args.store)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +0,0 @@
-#!/usr/bin/env bash
-
-./extract_baserom.py oot ner
-./extract_baserom.py oot ne0
-./extract_baserom.py oot ne1
-./extract_baserom.py oot np0
-./extract_baserom.py oot ne2
-./extract_baserom.py oot np1
-./extract_baserom.py oot cjo
-./extract_baserom.py oot cjm
-./extract_baserom.py oot ceo
-./extract_baserom.py oot cem
-./extract_baserom.py oot cpod1
-./extract_baserom.py oot cpmd
-./extract_baserom.py oot cpod2
-./extract_baserom.py oot cpo
-./extract_baserom.py oot cpm
-./extract_baserom.py oot cjc
-./extract_baserom.py oot iqs
-./extract_baserom.py oot iqt
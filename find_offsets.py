@@ -96,16 +96,24 @@ def main():
     parser.add_argument("code", help="code file to parse.")
     parser.add_argument("--csv", help="Output in CSV format.", action="store_true")
     parser.add_argument("--headers", help="Print CSV headers in CSV mode.", action="store_true")
+    parser.add_argument("--from-rom", help="Treat `code` as the name of a file of this version's rom, and read it from '{game}/{game}_{version}.z64' instead.", metavar="VERSION")
     args = parser.parse_args()
 
 
     
-    try:
-        with open(args.code, 'rb') as f:
-            data = f.read()
-    except IOError:
-        print('Failed to read file ' + args.code)
-        sys.exit(1)
+    if args.from_rom is not None:
+        from rom_archive import readBaseromFile
+        data = bytes(readBaseromFile(args.game, args.from_rom, args.code, fromRom=True))
+        if len(data) == 0:
+            print(f"Failed to read file {args.code} from the {args.from_rom} rom")
+            sys.exit(1)
+    else:
+        try:
+            with open(args.code, 'rb') as f:
+                data = f.read()
+        except IOError:
+            print('Failed to read file ' + args.code)
+            sys.exit(1)
 
     if args.csv:
         if args.headers:
@@ -1,10 +1,19 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 from os import path
 import argparse
+import json
+import os
 import sys
 import struct
 import hashlib
+from multiprocessing import Pool, cpu_count
+import random
+import time
+import tracemalloc
+import numpy as np
 
 CRC_VERSION = {
         # OoT
@@ -99,20 +108,95 @@ VERSIONS_MD5S = {
     }
 }
 
+ROM_CACHE_FILENAME = ".romcache.json"
+HASH_CHUNK_SIZE = 0x100000
+ROM_HEADER_SIZE = 0x40
+
+# When set, `getRomIdentity` collects its new cache entries here ({cache path: {key: entry}}) instead of
+# writing them, so the workers of `scanDirectory` don't race on the cache file. The parent writes them at the end.
+pendingRomCacheEntries: dict[str, dict[str, dict]] | None = None
+
 def getStrHash(byte_array):
     return str(hashlib.md5(byte_array).hexdigest())
 
+def getFileStrHash(filename) -> str:
+    md5 = hashlib.md5()
+    with open(filename, mode="rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def getRomCachePath(filename) -> str:
+    # One cache per game folder, i.e. `{game}/.romcache.json`
+    return path.join(path.dirname(filename), ROM_CACHE_FILENAME)
+
+def readRomCache(cachePath: str) -> dict:
+    try:
+        with open(cachePath) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return dict()
+
+def writeRomCache(cachePath: str, cache: dict):
+    tempPath = f"{cachePath}.{os.getpid()}.tmp"
+    try:
+        with open(tempPath, "w") as f:
+            json.dump(cache, f, indent=4, sort_keys=True)
+        os.replace(tempPath, cachePath)
+    except OSError:
+        # The cache is only an optimization, failing to write it is not fatal
+        pass
+
+def updateRomCache(cachePath: str, entries: dict[str, dict]):
+    # Read the cache again right before writing it, to keep the entries other processes wrote meanwhile
+    cache = readRomCache(cachePath)
+    cache.update(entries)
+    writeRomCache(cachePath, cache)
+
+def getRomIdentity(filename) -> dict:
+    """Returns the md5 of a ROM.
+
+    The result is remembered in a sidecar cache keyed by the real path of the
+    ROM, so it is found from any directory. Every entry only stores the md5,
+    the size and the modification time (`mtime_ns`) of the ROM, and unchanged
+    ROMs are not hashed again.
+    """
+    stat = os.stat(filename)
+    key = path.realpath(filename)
+    cachePath = getRomCachePath(filename)
+    cache = readRomCache(cachePath)
+
+    entry = cache.get(key)
+    if entry is not None and entry.get("size") == stat.st_size and entry.get("mtime_ns") == stat.st_mtime_ns:
+        return entry
+
+    entry = {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "md5": getFileStrHash(filename),
+    }
+    if pendingRomCacheEntries is not None:
+        pendingRomCacheEntries.setdefault(cachePath, dict())[key] = entry
+    else:
+        updateRomCache(cachePath, {key: entry})
+    return entry
+
 def checkExistingRom(filename, game_version):
     if not path.exists(filename):
         return False
 
-    with open(filename, mode="rb") as f:
-        fileContent = bytearray(f.read())
-        if getStrHash(fileContent) == VERSIONS_MD5S[game_version[0]][game_version[1]]:
-            return True
-    return False
+    return getRomIdentity(filename)["md5"] == VERSIONS_MD5S[game_version[0]][game_version[1]]
+
+def wordSwapFile(fileContent: bytearray) -> bytearray:
+    # Swap in place through a NumPy view of the buffer, so no copy of the ROM is made
+    np.frombuffer(fileContent, dtype=np.uint32, count=len(fileContent)//4).byteswap(inplace=True)
+    return fileContent
+
+def byteSwapFile(fileContent: bytearray) -> bytearray:
+    np.frombuffer(fileContent, dtype=np.uint16, count=len(fileContent)//2).byteswap(inplace=True)
+    return fileContent
 
-def wordSwapFile(fileContent):
+def wordSwapFileReference(fileContent):
     words = str(int(len(fileContent)/4))
     little_byte_format = "<" + words + "I"
     big_byte_format = ">" + words + "I"
@@ -120,7 +204,7 @@ def wordSwapFile(fileContent):
     struct.pack_into(big_byte_format, fileContent, 0, *tmp)
     return fileContent
 
-def byteSwapFile(fileContent):
+def byteSwapFileReference(fileContent):
     halfwords = str(int(len(fileContent)/2))
     little_byte_format = "<" + halfwords + "H"
     big_byte_format = ">" + halfwords + "H"
@@ -128,6 +212,25 @@ def byteSwapFile(fileContent):
     struct.pack_into(big_byte_format, fileContent, 0, *tmp)
     return fileContent
 
+def benchmarkSwaps(size: int):
+    original = bytearray(random.Random(0).randbytes(size))
+
+    for kind, swapFunc, referenceFunc in (("n64 (word swap)", wordSwapFile, wordSwapFileReference), ("v64 (byte swap)", byteSwapFile, byteSwapFileReference)):
+        results = []
+        for func in (referenceFunc, swapFunc):
+            fileContent = bytearray(original)
+            tracemalloc.start()
+            start = time.perf_counter()
+            fileContent = func(fileContent)
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results.append((elapsed, peak, getStrHash(fileContent)))
+
+        (refTime, refPeak, refHash), (newTime, newPeak, newHash) = results
+        assert refHash == newHash, f"{kind}: swapped output differs from the reference"
+        print(f"{kind}: struct: {refTime*1000:9.2f}ms {refPeak/(1024*1024):9.2f}MiB peak | in place: {newTime*1000:9.2f}ms {newPeak/(1024*1024):9.2f}MiB peak")
+
 def perVersionFixes(fileContent, game_version):
     if game_version == ["OOT", "CPMD"]:
         # Strip the overdump
@@ -146,35 +249,51 @@ def perVersionFixes(fileContent, game_version):
     return fileContent
 
 
-def fixBaserom(rom):
-    # Read in the original ROM
-    print("Using '" + rom + "'.")
-    with open(rom, mode="rb") as f:
-        fileContent = bytearray(f.read())
+def writeVerifiedRom(outRom: str, fileContent: bytearray, expectedHash: str) -> bool:
+    # Hash while writing to a temporary file, and only move it into place if the hash matches
+    tempRom = f"{outRom}.{os.getpid()}.tmp"
+    md5 = hashlib.md5()
+    view = memoryview(fileContent)
+    with open(tempRom, mode="wb") as file:
+        for offset in range(0, len(view), HASH_CHUNK_SIZE):
+            chunk = view[offset:offset+HASH_CHUNK_SIZE]
+            md5.update(chunk)
+            file.write(chunk)
 
+    if md5.hexdigest() != expectedHash:
+        os.remove(tempRom)
+        return False
+
+    os.replace(tempRom, outRom)
+    return True
+
+def detectRomVersion(fileContent) -> tuple[str, list[str] | None]:
+    """Returns the endianness of a ROM and its `CRC_VERSION` entry, or None if it isn't a known version. Only the header is read."""
     # Check if ROM needs to be byte/word swapped
     # Little-endian
     if fileContent[0] == 0x40:
         endian = "bad"
-        header = wordSwapFile(fileContent[0:0x40])
+        header = wordSwapFile(bytearray(fileContent[0:ROM_HEADER_SIZE]))
 
     # Byte-swapped
     elif fileContent[0] == 0x37:
         endian = "ugly"
-        header = byteSwapFile(fileContent[0:0x40])
+        header = byteSwapFile(bytearray(fileContent[0:ROM_HEADER_SIZE]))
 
     else:
         endian = "good"
-        header = fileContent[0:0x40]
+        header = fileContent[0:ROM_HEADER_SIZE]
 
     language = chr(header[0x3E])
     crc = header[0x10:0x18].hex()
 
-    game_version = CRC_VERSION[crc]
+    game_version = CRC_VERSION.get(crc)
 
     if game_version == None:
-        print("Does not appear to be a supported OoT or MM version: CRC not found.")
-        sys.exit(1)
+        return endian, None
+
+    # Don't modify the global table
+    game_version = list(game_version)
 
     if game_version[0] == "OOT" and language == "J":
         if game_version[1] == "NE0":
@@ -187,15 +306,37 @@ def fixBaserom(rom):
             game_version[1] = "NJ2"
             game_version[2] = "Nintendo 64 Japanese 1.2"
 
-    print("Detected ROM for " + game_version[0] + ", version " + game_version[1] + " (" + game_version[2] + ")")
+    return endian, game_version
 
+def getOutRomPath(game_version: list[str]) -> str:
     game_edition = [i.lower() for i in game_version]
-    outRom = path.join(game_edition[0], game_edition[0] + "_" + game_edition[1] + ".z64")
+    return path.join(game_edition[0], game_edition[0] + "_" + game_edition[1] + ".z64")
+
+def fixBaserom(rom) -> tuple[str, list[str] | None, str]:
+    """Returns the status of the fix (one of `FIX_STATUS_EXIT_CODES`), the detected version and the output path."""
+    # Read in the original ROM
+    print("Using '" + rom + "'.")
+    with open(rom, mode="rb") as f:
+        fileContent = bytearray(f.read())
+
+    if len(fileContent) < ROM_HEADER_SIZE:
+        print("File is too small to be a ROM.")
+        return "unknown", None, ""
+
+    endian, game_version = detectRomVersion(fileContent)
+
+    if game_version == None:
+        print("Does not appear to be a supported OoT or MM version: CRC not found.")
+        return "unknown", None, ""
+
+    print("Detected ROM for " + game_version[0] + ", version " + game_version[1] + " (" + game_version[2] + ")")
+
+    outRom = getOutRomPath(game_version)
 
     # If there already exists a correct ROM, we don't need to change anything
     if checkExistingRom(outRom, game_version):
         print("There is already a valid copy of this ROM in place. Will not copy.")
-        sys.exit(0)
+        return "exists", game_version, outRom
 
     # byte/word swap rest
     fileContent = {
@@ -207,29 +348,136 @@ def fixBaserom(rom):
     # Trim overdump
     fileContent = perVersionFixes(fileContent, game_version)
 
-    # Find and check hash
-    hash = getStrHash(fileContent)
-
-    if hash != VERSIONS_MD5S[game_version[0]][game_version[1]]:
-        print("Error: checksum incorrect after conversion.")
-        sys.exit(1)
-
-    # Move to new location
-
+    # Move to new location, checking the hash on the way
     print(f"Writing new ROM '{outRom}'.")
-    with open(outRom, mode="wb") as file:
-        file.write(bytes(fileContent))
+    if not writeVerifiedRom(outRom, fileContent, VERSIONS_MD5S[game_version[0]][game_version[1]]):
+        print("Error: checksum incorrect after conversion.")
+        return "bad checksum", game_version, outRom
 
     print("Done!")
+    return "written", game_version, outRom
+
+FIX_STATUS_EXIT_CODES = {
+    "written": 0,
+    "exists": 0,
+    "duplicate": 0,
+    "unknown": 1,
+    "bad checksum": 1,
+}
+
+ROM_EXTENSIONS = (".z64", ".n64", ".v64")
+
+def fixBaseromsForScan(roms: list[str]) -> tuple[list[tuple[str, str, list[str] | None, str]], dict[str, dict[str, dict]]]:
+    """Tries every ROM of `roms`, which are all candidates for the same output, until one of them is written (or was already in place).
+
+    The ROMs after that one are reported as duplicates. Returns the result of every ROM and the new rom cache entries.
+    """
+    global pendingRomCacheEntries
+    pendingRomCacheEntries = dict()
+
+    results = []
+    fixedRom = None
+    for rom in roms:
+        if fixedRom is not None:
+            print(f"Skipping '{rom}', '{fixedRom}' is already used for the same version.")
+            results.append((rom, "duplicate", game_version, outRom))
+            continue
+
+        try:
+            status, game_version, outRom = fixBaserom(rom)
+        except Exception as e:
+            # Report it and keep going with the rest of the ROMs
+            print(f"Error: could not process '{rom}': {e}")
+            status, game_version, outRom = "error", None, ""
+        results.append((rom, status, game_version, outRom))
+        if status in {"written", "exists"}:
+            fixedRom = rom
+    return results, pendingRomCacheEntries
+
+def getScanTarget(rom: str) -> tuple[list[str], str] | None:
+    """The version of `rom` and the path `fixBaserom` would write it to, or None if it can't tell from the header."""
+    try:
+        with open(rom, mode="rb") as f:
+            header = f.read(ROM_HEADER_SIZE)
+    except OSError:
+        return None
+    if len(header) < ROM_HEADER_SIZE:
+        return None
+    _, game_version = detectRomVersion(header)
+    if game_version is None:
+        return None
+    return game_version, getOutRomPath(game_version)
+
+def scanDirectory(directory: str, num_cores: int) -> int:
+    roms = []
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            if filename.lower().endswith(ROM_EXTENSIONS):
+                roms.append(path.join(dirpath, filename))
+    roms.sort()
+
+    if len(roms) == 0:
+        print(f"No ROMs found in '{directory}'.")
+        return 1
+
+    # The ROMs of the same version are tried one after the other by a single worker, so two workers never write the same output
+    # and a bad dump doesn't stop a good one of the same version from being used
+    tasks: list[list[str]] = []
+    candidatesPerTarget: dict[str, list[str]] = dict()
+    for rom in roms:
+        target = getScanTarget(rom)
+        if target is None:
+            tasks.append([rom])
+            continue
+        _, outRom = target
+        if outRom not in candidatesPerTarget:
+            candidatesPerTarget[outRom] = []
+            tasks.append(candidatesPerTarget[outRom])
+        candidatesPerTarget[outRom].append(rom)
+
+    results = []
+    cacheEntries: dict[str, dict[str, dict]] = dict()
+    with Pool(max(1, min(num_cores, len(tasks)))) as p:
+        for taskResults, newCacheEntries in p.imap_unordered(fixBaseromsForScan, tasks):
+            results.extend(taskResults)
+            for cachePath, entries in newCacheEntries.items():
+                cacheEntries.setdefault(cachePath, dict()).update(entries)
+    results.sort(key=lambda result: result[0])
+
+    for cachePath, entries in cacheEntries.items():
+        updateRomCache(cachePath, entries)
+
+    print()
+    print(f"{'ROM':<50} {'Game':<5} {'Version':<12} {'Status':<13} Output")
+    exitCode = 0
+    for rom, status, game_version, outRom in results:
+        game, version = ("", "") if game_version is None else (game_version[0], game_version[1])
+        print(f"{rom:<50} {game:<5} {version:<12} {status:<13} {outRom}")
+        exitCode = max(exitCode, FIX_STATUS_EXIT_CODES.get(status, 1))
+    return exitCode
 
 def main():
     description = "Fixes and copies/renames an OoT/MM ROM."
 
     parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
-    parser.add_argument("rom", help="Zelda64 ROM to fix and move.")
+    parser.add_argument("rom", help="Zelda64 ROM to fix and move.", nargs="?")
+    parser.add_argument("--scan", help="Fix every .z64/.n64/.v64 ROM found inside the given directory.", metavar="DIR")
+    parser.add_argument("-j", help="Number of ROMs processed at the same time by --scan. Defaults to every CPU core.", type=int, default=cpu_count())
+    parser.add_argument("--bench", help="Time the in-place byte/word swaps against the old struct-based ones on random data of the given size (defaults to 0x2000000).", nargs="?", const="0x2000000", default=None)
     args = parser.parse_args()
 
-    fixBaserom(args.rom)
+    if args.bench is not None:
+        benchmarkSwaps(int(args.bench, 0))
+        return
+
+    if args.scan is not None:
+        sys.exit(scanDirectory(args.scan, args.j))
+
+    if args.rom is None:
+        parser.error("the following arguments are required: rom")
+
+    status, _, _ = fixBaserom(args.rom)
+    sys.exit(FIX_STATUS_EXIT_CODES[status])
 
 
 if __name__ == "__main__":
@@ -3,10 +3,11 @@
 # Consider merging this script with vram.py, since that is doing almost all of the work.
 
 import argparse
-import csv
 import vram
 import sys
 
+from tools.mips.DmaTable import DmaTable
+
 def main():
     description = "Uses dmadata and dlftbls to find "
 
@@ -17,12 +18,8 @@ def main():
     # parser.add_argument("--outFile", help="File to write to", default=sys.stdout)
     args = parser.parse_args()
 
-    with open(args.dmadata, "r") as f:
-        dmalist = list(csv.reader(f))
-
-    dmadata = []
-    for entry in dmalist:
-        dmadata.append([entry[0], *map(lambda x: int(x, 16), entry[1:5])])
+    dmaTable = DmaTable.fromCsv(args.dmadata)
+    dmadata = [[name, *entry] for name, entry in zip(dmaTable.names, dmaTable)]
 
     overlayTable = vram.constructOverlayTable(args.code, args.game)
 
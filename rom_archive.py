@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+from collections import OrderedDict
+from pathlib import Path
+import sys
+
+from compression import detectCodecOrFail
+from decompression_cache import DecompressionCache, decompressMaybeCached
+from extract_baserom import FILE_TABLE_OFFSET, FILE_NAMES, ROM_FILE_NAME_V, readFilelists, map_rom_file
+from tools.mips.BaseromPack import BaseromPack, getBaseromPackPath
+from tools.mips.DmaTable import DmaTable
+
+
+DEFAULT_ARCHIVE_CACHE_SIZE = 256 * 1024 * 1024 # 256 MiB
+
+
+class RomArchive:
+    """Reads the files of a rom by name, without extracting them to `baserom/` first.
+
+    The rom is mapped into memory and its dmadata is parsed once. Uncompressed
+    files are returned as a memoryview of the rom itself, while compressed ones
+    are decompressed on demand and kept in a LRU cache bounded by `cacheSize`
+    bytes.
+
+    Every memoryview returned by `getFile` must be released before calling `close`.
+    """
+
+    def __init__(self, game: str, edition: str, cacheSize: int = DEFAULT_ARCHIVE_CACHE_SIZE, decompressionCache: DecompressionCache | None = None, romPath: Path | None = None):
+        self.game = game
+        self.edition = edition
+        self.cacheSize = cacheSize
+        self.decompressionCache = decompressionCache
+
+        Game = game.upper()
+        Version = edition.upper().replace("_", " ")
+        if Version not in FILE_TABLE_OFFSET[Game]:
+            raise ValueError(f"Unknown version '{edition}' for the game '{game}'")
+        if FILE_NAMES[Game][Version] is None:
+            readFilelists()
+        fileNames = FILE_NAMES[Game][Version]
+        if fileNames is None:
+            raise ValueError(f"'{edition}' is not supported yet because the filelist is missing.")
+
+        if romPath is None:
+            romPath = Path(game, ROM_FILE_NAME_V.format(game, edition))
+        self.romData = map_rom_file(romPath)
+
+        self.dmaTable = DmaTable.fromRom(self.romData, FILE_TABLE_OFFSET[Game][Version], len(fileNames)).withNames(fileNames)
+
+        # name: (vrom start, vrom end, rom start, rom end)
+        self.entries: dict[str, tuple[int, int, int, int]] = dict()
+        for name, entry, deleted in zip(fileNames, self.dmaTable, self.dmaTable.deletedMask.tolist()):
+            if name == "":
+                continue
+            vStart, vEnd, _, _ = entry
+            if deleted and vEnd - vStart == 0:
+                continue
+            self.entries[name] = entry
+
+        self.cache: OrderedDict[str, bytes] = OrderedDict()
+        self.cacheUsage = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def names(self) -> list[str]:
+        return list(self.entries)
+
+    def getFileSize(self, name: str) -> int:
+        vStart, vEnd, _, _ = self.entries[name]
+        return vEnd - vStart
+
+    def getFile(self, name: str) -> memoryview:
+        vStart, vEnd, pStart, pEnd = self.entries[name]
+
+        if pStart == 0xFFFFFFFF and pEnd == 0xFFFFFFFF:
+            # Deleted files are extracted as zeroes
+            return memoryview(bytes(vEnd - vStart))
+        if pEnd == 0:
+            return memoryview(self.romData)[pStart:pStart + vEnd - vStart]
+
+        data = self.cache.get(name)
+        if data is not None:
+            self.cache.move_to_end(name)
+            return memoryview(data)
+
+        compressed = memoryview(self.romData)[pStart:pEnd]
+        codec = detectCodecOrFail(compressed)
+        data = decompressMaybeCached(self.decompressionCache, codec.name, compressed, codec.decompress)
+        compressed.release()
+
+        self.cache[name] = data
+        self.cacheUsage += len(data)
+        # Always keep the newest entry, even if it doesn't fit by itself
+        while self.cacheUsage > self.cacheSize and len(self.cache) > 1:
+            _, evicted = self.cache.popitem(last=False)
+            self.cacheUsage -= len(evicted)
+        return memoryview(data)
+
+    def close(self):
+        self.cache.clear()
+        self.cacheUsage = 0
+        self.romData.close()
+
+
+# Archives opened by `getRomArchive`, one per version and per process
+openedArchives: dict[tuple[str, str], RomArchive | None] = dict()
+
+def getRomArchive(game: str, edition: str) -> RomArchive | None:
+    """Returns the archive of the given version, or None if its rom is missing."""
+    key = (game, edition)
+    if key not in openedArchives:
+        try:
+            openedArchives[key] = RomArchive(game, edition, decompressionCache=DecompressionCache())
+        except (OSError, ValueError):
+            openedArchives[key] = None
+    return openedArchives[key]
+
+# Packs opened by `getBaseromPack`, one per version and per process
+openedPacks: dict[tuple[str, str], BaseromPack | None] = dict()
+
+def getBaseromPack(game: str, edition: str) -> BaseromPack | None:
+    """Returns the baserom pack of the given version, or None if it wasn't extracted with `--pack`."""
+    key = (game, edition)
+    if key not in openedPacks:
+        try:
+            openedPacks[key] = BaseromPack(getBaseromPackPath(game, edition))
+        except (OSError, ValueError):
+            openedPacks[key] = None
+    return openedPacks[key]
+
+def readBaseromFile(game: str, edition: str, filename: str, fromRom: bool = False) -> bytearray:
+    """Reads `{game}/{edition}/baserom/{filename}`, or the same file straight from the rom if `fromRom` is set.
+
+    If the file is not in the baserom folder, it is looked up in `{game}/{edition}/baserom.pack` instead.
+    An empty bytearray is returned if the file doesn't exist, like `spimdisasm.common.Utils.readFileAsBytearray` does.
+    """
+    if not fromRom:
+        try:
+            return bytearray(Path(game, edition, "baserom", filename).read_bytes())
+        except OSError:
+            pass
+        pack = getBaseromPack(game, edition)
+        if pack is None or filename not in pack:
+            return bytearray()
+        return bytearray(pack.getFile(filename))
+
+    archive = getRomArchive(game, edition)
+    if archive is None or filename not in archive:
+        return bytearray()
+    return bytearray(archive.getFile(filename))
+
+
+def main():
+    description = "Lists the files of a rom, or writes one of them, without extracting the whole rom."
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("game", help="Game of the rom.", choices=["oot", "mm", "dnm"])
+    parser.add_argument("edition", help="Version of the rom.")
+    parser.add_argument("filename", help="File to read. Lists every file if not given.", nargs="?")
+    parser.add_argument("-o", "--output", help="Where to write the file. Defaults to stdout.", type=Path)
+    args = parser.parse_args()
+
+    try:
+        archive = RomArchive(args.game, args.edition, decompressionCache=DecompressionCache())
+    except (OSError, ValueError) as e:
+        print(e)
+        sys.exit(1)
+
+    if args.filename is None:
+        for name in archive.names():
+            vStart, vEnd, pStart, pEnd = archive.entries[name]
+            print(f"{name},{vStart:X},{vEnd:X},{pStart:X},{pEnd:X}")
+        return
+
+    if args.filename not in archive:
+        print(f"'{args.filename}' is not a file of {args.game} {args.edition}")
+        sys.exit(1)
+
+    data = archive.getFile(args.filename)
+    if args.output is not None:
+        args.output.write_bytes(data)
+    else:
+        sys.stdout.buffer.write(data)
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+from pathlib import Path
+import pickle
+
+from disk_lru_cache import DiskLruCache, cacheMain
+
+
+DEFAULT_CACHE_DIR = Path(".cache", "section_hashes")
+DEFAULT_CACHE_MAX_SIZE = 64 * 1024 * 1024 # 64 MiB
+
+
+class SectionHashCache(DiskLruCache):
+    """On-disk cache of the section hashes computed by `compare_all_versions.py`.
+
+    Entries are keyed by everything the analysis of a file depends on: the
+    file's bytes, its splits, the tables read into the Context of its
+    version, and `settings` (the spimdisasm version and the options that
+    change the hashes). Editing the symbols of one version only invalidates
+    the files of that version. Every entry is a pickled dict.
+    """
+
+    def __init__(self, settings: tuple, directory: Path = DEFAULT_CACHE_DIR, maxSize: int = DEFAULT_CACHE_MAX_SIZE):
+        super().__init__(directory, maxSize)
+        self.settings = settings
+
+    def getEntryPath(self, key: tuple) -> Path:
+        return self.getKeyPath(repr((self.settings, key)).encode())
+
+    def get(self, key: tuple) -> dict[str, str] | None:
+        data = self.readEntry(self.getEntryPath(key))
+        if data is None:
+            return None
+        try:
+            return pickle.loads(data)
+        except (pickle.UnpicklingError, EOFError):
+            return None
+
+    def put(self, key: tuple, sectionHashes: dict[str, str]):
+        self.writeEntry(self.getEntryPath(key), pickle.dumps(sectionHashes))
+
+
+def main():
+    cacheMain("Shows the size of the section hash cache of `compare_all_versions.py`, or trims it.", lambda directory, maxSize: SectionHashCache((), directory, maxSize), DEFAULT_CACHE_DIR, DEFAULT_CACHE_MAX_SIZE)
+
+
+if __name__ == "__main__":
+    main()
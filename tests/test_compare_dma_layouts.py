@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import numpy as np
+
+from compare_dma_layouts import DmaLayouts
+from tools.mips.DmaTable import DMA_ENTRY_DTYPE, DmaTable
+
+
+def makeTable(entries: list[tuple[int, int, int, int]], names: list[str]) -> DmaTable:
+    return DmaTable(np.array(entries, dtype=DMA_ENTRY_DTYPE), names)
+
+
+def test_more_names_than_entries():
+    # Like a filelist which names files past the end of dmadata
+    ne0 = makeTable([(0x0, 0x10, 0x0, 0x0), (0x10, 0x20, 0x10, 0x0)], ["file_a", "file_b", "extra_a"])
+    ne1 = makeTable([(0x0, 0x10, 0x0, 0x0), (0x10, 0x30, 0x10, 0x0)], ["file_a", "file_b"])
+
+    layouts = DmaLayouts(["ne0", "ne1"], {"ne0": ne0, "ne1": ne1})
+    assert layouts.fileNames == ["file_a", "file_b"]
+    assert layouts.size.tolist() == [[0x10, 0x10], [0x10, 0x20]]
+    assert layouts.firstChangedIn(1) == "ne1"
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import struct
+
+import extract_baserom
+from tools.mips.DmaTable import DmaTable
+
+
+DMA_OFFSET = 0x10
+
+# Two files, the terminator, and one more zeroed entry before the rom ends
+ENTRIES = [
+    (0x0000, 0x0010, 0x0000, 0x0000),
+    (0x0010, 0x0020, 0x0010, 0x0000),
+]
+
+
+def makeRom() -> bytes:
+    rom = bytearray(DMA_OFFSET)
+    for entry in ENTRIES:
+        rom += struct.pack(">4I", *entry)
+    rom += bytes(0x20)
+    return bytes(rom)
+
+
+def test_fromRom_stops_at_terminator():
+    table = DmaTable.fromRom(makeRom(), DMA_OFFSET)
+    assert list(table) == ENTRIES
+
+
+def test_fromRom_reads_count_entries_past_terminator():
+    # The 3rd and 4th entries are zeroes in the rom, the 5th one is past its end
+    table = DmaTable.fromRom(makeRom(), DMA_OFFSET, 5)
+    assert list(table) == ENTRIES + [(0, 0, 0, 0)] * 3
+
+
+def test_extract_dma_with_filelist_longer_than_dmadata(tmp_path, monkeypatch):
+    fileNames = ["file_a", "file_b", "extra_a", "extra_b"]
+    (tmp_path / "mm").mkdir()
+    (tmp_path / "mm" / "ne0" / "tables").mkdir(parents=True)
+    (tmp_path / "mm" / "mm_ne0.z64").write_bytes(makeRom())
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setitem(extract_baserom.FILE_TABLE_OFFSET["MM"], "NE0", DMA_OFFSET)
+    monkeypatch.setitem(extract_baserom.FILE_NAMES["MM"], "NE0", fileNames)
+    monkeypatch.setattr(extract_baserom, "OnlyDma", True)
+    extract_baserom.set_version("mm", "ne0")
+    extract_baserom.initialize_worker("mm/mm_ne0.z64", None, dict())
+
+    dmaTable: dict[str, list[int]] = {name: list() for name in fileNames}
+    for i in range(len(fileNames)):
+        extract_baserom.addDmaEntry(dmaTable, extract_baserom.ExtractFunc(i))
+    extract_baserom.writeDma(dmaTable)
+
+    lines = (tmp_path / "mm" / "ne0" / "tables" / "dma_addresses.csv").read_text().splitlines()
+    assert lines == [
+        "file_a,0,10,0,0",
+        "file_b,10,20,10,0",
+        "extra_a,0,0,0,0",
+        "extra_b,0,0,0,0",
+    ]
+
+
+def test_withNames_matches_the_length_of_the_table():
+    table = DmaTable.fromRom(makeRom(), DMA_OFFSET)
+    assert table.withNames(["file_a", "file_b", "extra_a"]).names == ["file_a", "file_b"]
+    assert table.withNames(["file_a"]).names == ["file_a", ""]
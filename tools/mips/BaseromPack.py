@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import argparse
+import mmap
+from pathlib import Path
+import struct
+import sys
+
+
+# A baserom pack stores every extracted file of a version back-to-back in a single file.
+#
+# Layout:
+# - Header: magic, format version, amount of entries.
+# - Index: one fixed-size entry per file, in filelist order: name (NUL padded), offset of the payload, size and blake2b hash of the payload.
+# - Payloads, each one aligned to PACK_ALIGNMENT.
+
+PACK_MAGIC = b"Z64P"
+PACK_FORMAT_VERSION = 1
+PACK_NAME_SIZE = 0x30
+PACK_HASH_SIZE = 20
+PACK_ALIGNMENT = 0x10
+
+PACK_HEADER = struct.Struct(">4sII4x")
+PACK_ENTRY = struct.Struct(f">{PACK_NAME_SIZE}sII{PACK_HASH_SIZE}s4x")
+
+
+class BaseromPackEntry:
+    def __init__(self, name: str, offset: int, size: int, dataHash: bytes = bytes(PACK_HASH_SIZE)):
+        self.name: str = name
+        self.offset: int = offset
+        self.size: int = size
+        self.dataHash: bytes = dataHash
+
+    def __str__(self) -> str:
+        return f"<BaseromPackEntry {self.name} Offset: 0x{self.offset:X} Size: 0x{self.size:X}>"
+
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def getBaseromPackPath(game: str, version: str) -> Path:
+    return Path(game, version, "baserom.pack")
+
+def layoutBaseromPack(files: list[tuple[str, int]]) -> tuple[list[BaseromPackEntry], int]:
+    """Places every `(name, size)` after the index. Returns the entries and the total size of the pack."""
+    offset = PACK_HEADER.size + PACK_ENTRY.size * len(files)
+    entries = []
+    for name, size in files:
+        assert len(name.encode()) <= PACK_NAME_SIZE, f"File name too long for a baserom pack: {name}"
+        offset = (offset + PACK_ALIGNMENT - 1) & ~(PACK_ALIGNMENT - 1)
+        entries.append(BaseromPackEntry(name, offset, size))
+        offset += size
+    return entries, offset
+
+def packBaseromIndex(entries: list[BaseromPackEntry]) -> bytes:
+    index = bytearray(PACK_HEADER.pack(PACK_MAGIC, PACK_FORMAT_VERSION, len(entries)))
+    for entry in entries:
+        index.extend(PACK_ENTRY.pack(entry.name.encode(), entry.offset, entry.size, entry.dataHash))
+    return bytes(index)
+
+
+class BaseromPack:
+    """Read-only view of a baserom pack. The pack is mapped into memory, so reading a file doesn't copy it."""
+
+    def __init__(self, path: Path):
+        with Path(path).open("rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, formatVersion, count = PACK_HEADER.unpack_from(self.data, 0)
+        if magic != PACK_MAGIC or formatVersion != PACK_FORMAT_VERSION:
+            self.data.close()
+            raise ValueError(f"'{path}' is not a baserom pack, or it was written by an incompatible version")
+
+        self.entries: dict[str, BaseromPackEntry] = dict()
+        for i in range(count):
+            name, offset, size, dataHash = PACK_ENTRY.unpack_from(self.data, PACK_HEADER.size + PACK_ENTRY.size * i)
+            name = name.rstrip(b"\0").decode()
+            self.entries[name] = BaseromPackEntry(name, offset, size, dataHash)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.entries
+
+    def names(self) -> list[str]:
+        return list(self.entries)
+
+    def getFile(self, name: str) -> memoryview:
+        entry = self.entries[name]
+        return memoryview(self.data)[entry.offset:entry.offset + entry.size]
+
+    def getHash(self, name: str) -> str:
+        return self.entries[name].dataHash.hex()
+
+    def close(self):
+        self.data.close()
+
+
+def main():
+    description = "Lists the files of a baserom pack, or writes one of them."
+
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument("pack", help="Path to the baserom pack, usually '{game}/{version}/baserom.pack'.", type=Path)
+    parser.add_argument("filename", help="File to read. Lists every file if not given.", nargs="?")
+    parser.add_argument("-o", "--output", help="Where to write the file. Defaults to stdout.", type=Path)
+    args = parser.parse_args()
+
+    with BaseromPack(args.pack) as pack:
+        if args.filename is None:
+            for entry in pack.entries.values():
+                print(f"{entry.name},{entry.offset:X},{entry.size:X},{entry.dataHash.hex()}")
+            return
+
+        if args.filename not in pack:
+            print(f"'{args.filename}' is not in '{args.pack}'")
+            sys.exit(1)
+
+        data = pack.getFile(args.filename)
+        if args.output is not None:
+            args.output.write_bytes(data)
+        else:
+            sys.stdout.buffer.write(data)
+            sys.stdout.flush()
+        data.release()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import csv
+from pathlib import Path
+from typing import Iterator
+import numpy as np
+
+
+DMA_ENTRY_DTYPE = np.dtype([
+    ("vromStart", ">u4"),
+    ("vromEnd", ">u4"),
+    ("romStart", ">u4"),
+    ("romEnd", ">u4"),
+])
+
+# Amount of entries read at a time while looking for the end of the table
+DMA_SCAN_CHUNK = 0x400
+
+
+class DmaTable:
+    """The dmadata of a rom, backed by a NumPy structured array of big-endian words.
+
+    A file is deleted if both of its rom addresses are 0xFFFFFFFF, uncompressed
+    if its rom end is 0, and compressed otherwise.
+    """
+
+    def __init__(self, entries: np.ndarray, names: list[str] | None = None):
+        self.entries: np.ndarray = entries
+        self.names: list[str] | None = names
+
+    @staticmethod
+    def fromRom(romData, offset: int, count: int | None = None) -> DmaTable:
+        """Parses the table at `offset`, stopping at the first all-zero entry.
+
+        If `count` is given exactly that many entries are read instead, even past the terminator, since some filelists
+        name files after it. Entries past the end of the rom are read as zeroes.
+        """
+        words = np.frombuffer(romData, dtype=">u4", count=(len(romData) - offset) // 4, offset=offset)
+        if count is not None:
+            available = min(count, len(words) // 4)
+            entries = np.zeros(count, dtype=DMA_ENTRY_DTYPE)
+            entries[:available] = words[:available * 4].view(DMA_ENTRY_DTYPE)
+            return DmaTable(entries)
+
+        totalEntries = len(words) // 4
+
+        # Look for the terminator a chunk at a time, the table is usually much smaller than the rest of the rom
+        end = totalEntries
+        for chunkStart in range(0, totalEntries, DMA_SCAN_CHUNK):
+            chunkEnd = min(chunkStart + DMA_SCAN_CHUNK, totalEntries)
+            chunk = words[chunkStart * 4:chunkEnd * 4].reshape(-1, 4)
+            terminators = np.flatnonzero(~chunk.any(axis=1))
+            if len(terminators) > 0:
+                end = chunkStart + int(terminators[0])
+                break
+
+        # Copy it, so the table doesn't keep the rom buffer alive
+        entries = words[:end * 4].view(DMA_ENTRY_DTYPE).copy()
+        return DmaTable(entries)
+
+    @staticmethod
+    def fromCsv(path: Path) -> DmaTable:
+        """Reads a `dma_addresses.csv` written by `extract_baserom.py`. Rows without addresses are skipped."""
+        names = []
+        rows = []
+        with Path(path).open() as f:
+            for row in csv.reader(f):
+                if len(row) < 5:
+                    continue
+                names.append(row[0])
+                rows.append(tuple(int(x, 16) for x in row[1:5]))
+        return DmaTable(np.array(rows, dtype=DMA_ENTRY_DTYPE), names)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, index: int) -> tuple[int, int, int, int]:
+        return tuple(int(x) for x in self.entries[index])
+
+    def __iter__(self) -> Iterator[tuple[int, int, int, int]]:
+        return iter(self.entries.tolist())
+
+    def withNames(self, names: list[str]) -> DmaTable:
+        """Returns the same entries named by `names`, cut or padded with empty names to the length of the table."""
+        names = list(names[:len(self.entries)]) + [""] * (len(self.entries) - len(names))
+        return DmaTable(self.entries, names)
+
+    @property
+    def vromStart(self) -> np.ndarray:
+        return self.entries["vromStart"]
+
+    @property
+    def vromEnd(self) -> np.ndarray:
+        return self.entries["vromEnd"]
+
+    @property
+    def romStart(self) -> np.ndarray:
+        return self.entries["romStart"]
+
+    @property
+    def romEnd(self) -> np.ndarray:
+        return self.entries["romEnd"]
+
+    @property
+    def deletedMask(self) -> np.ndarray:
+        return (self.romStart == 0xFFFFFFFF) & (self.romEnd == 0xFFFFFFFF)
+
+    @property
+    def compressedMask(self) -> np.ndarray:
+        return (self.romEnd != 0) & ~self.deletedMask
+
+    @property
+    def uncompressedMask(self) -> np.ndarray:
+        return self.romEnd == 0
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """Size of every file once extracted."""
+        return self.vromEnd.astype(np.int64) - self.vromStart.astype(np.int64)
+
+    @property
+    def romSizes(self) -> np.ndarray:
+        """Size of every file inside the rom. Deleted files take no space."""
+        romSizes = np.where(self.compressedMask, self.romEnd.astype(np.int64) - self.romStart.astype(np.int64), self.sizes)
+        romSizes[self.deletedMask] = 0
+        return romSizes
+
+    def findVrom(self, vrom: int) -> int:
+        """Returns the index of the file which contains `vrom`, or -1. Expects the table to be sorted by vrom, like every dmadata is."""
+        index = int(np.searchsorted(self.vromStart, vrom, side="right")) - 1
+        if index < 0 or vrom >= self.vromEnd[index]:
+            return -1
+        return index
+
+    def toBytes(self) -> bytes:
+        return self.entries.tobytes()
@@ -108,13 +108,20 @@ def constructFbdemoTable(data, game):
         i += 1
     return fbdemoTable
 
-def constructOverlayTable(code, game):
-    try:
-        with open(code, 'rb') as f:
-            data = f.read()
-    except IOError:
-        print('Failed to read file ' + code)
-        sys.exit(1)
+def constructOverlayTable(code, game, fromRom=None):
+    if fromRom is not None:
+        from rom_archive import readBaseromFile
+        data = bytes(readBaseromFile(game, fromRom, code, fromRom=True))
+        if len(data) == 0:
+            print(f"Failed to read file {code} from the {fromRom} rom")
+            sys.exit(1)
+    else:
+        try:
+            with open(code, 'rb') as f:
+                data = f.read()
+        except IOError:
+            print('Failed to read file ' + code)
+            sys.exit(1)
 
     overlayTable = []
     overlayTable.extend(constructActorTable(data, game))
@@ -136,6 +143,7 @@ def main():
     parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("game", help="Game to use")
     parser.add_argument("code", help="code file to read")
+    parser.add_argument("--from-rom", help="Treat `code` as the name of a file of this version's rom, and read it from '{game}/{game}_{version}.z64' instead.", metavar="VERSION")
     # parser.add_argument("--outFile", help="File to write to", default=sys.stdout)
     args = parser.parse_args()
 
@@ -145,7 +153,7 @@ def main():
     #         print(f"{number:X},",end="")
     #     print("")
     
-    overlayTable = constructOverlayTable(args.code, args.game)
+    overlayTable = constructOverlayTable(args.code, args.game, args.from_rom)
 
     for entry in overlayTable:
         for number in entry[:4]: